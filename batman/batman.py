@@ -5,6 +5,7 @@ Script to run batman routing protocol on R2lab
 """
 
 
+import sys
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 from pathlib import Path
 
@@ -15,7 +16,9 @@ from apssh import Run, RunScript, Pull
 from apssh import TimeColonFormatter
 
 # helpers
-from processmap import Aggregator
+from processmap import ArrayAggregator
+from simtestbed import SimTestbed
+from jobtimer import JobTimer, timing_name
 from listofchoices import ListOfChoices
 from channels import channel_frequency
 
@@ -26,6 +29,17 @@ default_run_name     = 'logs_batman'
 # a fixed amount of time that we wait for,
 # once all the nodes have their wireless interface configured
 settle_delay         = 60
+# how jobtimer groups jobs into phases, after their labels
+timing_phases = [
+    ("lease", "check lease"),
+    ("load", "load images"),
+    ("batman", "init and run batman"),
+    ("init", "init "),
+    ("tcpdump", "run tcpdump"),
+    ("settle", "settling"),
+    ("pings", "ping "),
+    ("retrieve", "retrieve "),
+]
 # antenna mask for each node, three values are allowed: 1, 3, 7
 #choices_antenna_mask = [1, 3, 7]
 choices_antenna_mask = [1]
@@ -157,6 +171,7 @@ def one_run(tx_power, phy_rate, antenna_mask, channel, *,
         node=faraday,
         verbose=verbose_jobs,
         critical=True,
+        label="check lease",
         command=Run("rhubarbe leases --check"),
     )
 
@@ -176,6 +191,7 @@ def one_run(tx_power, phy_rate, antenna_mask, channel, *,
             critical=True,
             scheduler=scheduler,
             verbose=verbose_jobs,
+            label="load images",
             commands=[
                 Run("rhubarbe", "off", "-a", *negated_node_ids),
                 Run("rhubarbe", "load", "-i", "u16-ath-noreg", *node_ids),
@@ -342,7 +358,11 @@ def one_run(tx_power, phy_rate, antenna_mask, channel, *,
         jobs_window = parallel
 
     # if not in dry-run mode, let's proceed to the actual experiment
+    timer = JobTimer(scheduler, phases=timing_phases)
     ok = scheduler.orchestrate(jobs_window=jobs_window)
+    # where the time went
+    timer.save(run_root / timing_name)
+    print(timer.report())
     # give details if it failed
     if not ok:
         scheduler.debrief()
@@ -350,7 +370,7 @@ def one_run(tx_power, phy_rate, antenna_mask, channel, *,
     # data acquisition is done, let's aggregate results
     # i.e. compute averages
     if ok:
-        post_processor = Aggregator(run_root, node_ids, antenna_mask)
+        post_processor = ArrayAggregator(run_root, node_ids, antenna_mask)
         post_processor.run()
 
     return ok
@@ -443,6 +463,10 @@ def main():
     # parser.add_argument("-N", "--ping-number", default=ping_number,
     #                    help="specify number of ping packets to send")
 
+    parser.add_argument("--simulate", default=False, action='store_true',
+                        help="run on virtual nodes, with no access to the testbed;"
+                        " see simtestbed.py")
+
     parser.add_argument("-n", "--dry-run", default=False, action='store_true',
                         help="do not run anything, just print out scheduler,"
                         " and generate .dot file")
@@ -452,8 +476,13 @@ def main():
                         help="run jobs and engine in verbose mode")
     args = parser.parse_args()
 
+    if args.simulate:
+        # nodes are laid out on a grid, and routing is not simulated
+        testbed = SimTestbed()
+        testbed.install(sys.modules[__name__])
+
     # run the experiment on all specified input values
-    return all_runs(tx_powers=args.tx_powers, phy_rates=args.phy_rates,
+    ok = all_runs(tx_powers=args.tx_powers, phy_rates=args.phy_rates,
                     antenna_masks=args.antenna_masks, channels=args.channels,
                     run_name=args.run_name,
                     slicename=args.slicename,
@@ -469,6 +498,9 @@ def main():
                     # ping_number = args.ping_number
                     # wireless_driver   = args.wifi_driver
                    )
+    if args.simulate:
+        testbed.cleanup()
+    return ok
 
 
 ##########
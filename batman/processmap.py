@@ -2,6 +2,8 @@
 helper tools for aggregating (averaging) multiple rssi reports
 """
 
+import numpy as np
+
 class Averager:
     """
     For each couple (receiver, sender) we gather
@@ -96,3 +98,155 @@ class Aggregator:
                     sender, receiver)
                 line += "\t".join("{0:.2f}".format(v) for v in avgs)
                 aggregate_file.write(line + "\n")
+
+
+########################################
+# vectorized flavour
+#
+# Aggregator above deals with one packet at a time, and with N**2
+# Averager objects; this is fine for small runs, but campaigns
+# produce millions of captured frames per config
+# what follows parses result files in bulk as integer arrays,
+# and reduces them with grouped sums and counts
+
+# turn '10.0.0.1\t10.0.0.2\t-40,-42' into '10 0 0 1\t10 0 0 2\t-40 -42'
+_result_separators = str.maketrans('.,', '  ')
+
+
+def load_result(result_name, columns):
+    """
+    parses one result-<N>.txt file as produced by process-pcap
+
+    Parameters:
+        result_name: a pathlib Path
+        columns: the number of rssi values to retain for each frame
+
+    Returns:
+        a tuple senders, receivers, rssis of numpy arrays; senders
+        and receivers hold node ids (last byte of the IP address), and
+        rssis has shape (number_of_frames, columns)
+    """
+    text = result_name.read_text().translate(_result_separators).strip()
+    if not text:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros((0, columns), dtype=np.int64))
+    nb_lines = text.count('\n') + 1
+    # 4 bytes for each IP address, and then the rssi values
+    width = len(text.partition('\n')[0].split())
+    # frames do not all report the same number of antennas, so the
+    # number of values is checked on each line before reshaping
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    blank = chars <= ord(' ')
+    starts = ~blank
+    starts[1:] &= blank[:-1]
+    line_starts = np.r_[0, np.flatnonzero(chars == ord('\n')) + 1]
+    line_widths = np.add.reduceat(starts.view(np.uint8), line_starts,
+                                  dtype=np.int64)
+    if width >= 8 + columns and np.all(line_widths == width):
+        values = np.fromstring(text, dtype=np.int64, sep=' ')
+        values = values.reshape(nb_lines, width)
+    else:
+        # lines are not all alike, go for the slow path
+        values = np.array([[int(x) for x in line.split()[:8 + columns]]
+                           for line in text.splitlines()], dtype=np.int64)
+    return values[:, 3], values[:, 7], values[:, 8:8 + columns]
+
+
+def write_rssi(aggregate_name, node_ids, averages):
+    """
+    writes a RSSI.txt file from a [sender, receiver, column] array
+    where sender and receiver are ranks in node_ids
+    """
+    with aggregate_name.open("w") as aggregate_file:
+        for s, sender in enumerate(node_ids):
+            for r, receiver in enumerate(node_ids):
+                line = "10.0.0.{:02d}\t10.0.0.{:02d}\t".format(
+                    sender, receiver)
+                line += "\t".join("{0:.2f}".format(v)
+                                  for v in averages[s, r].tolist())
+                aggregate_file.write(line + "\n")
+
+
+class ArrayAggregator:
+
+    """
+    a drop-in replacement for Aggregator, that produces
+    the exact same RSSI.txt
+
+    all result files are loaded as numpy arrays, and accumulated
+    into dense counts and totals, indexed by
+    [sender, receiver] and [sender, receiver, column]
+    where sender and receiver are ranks in node_ids
+    """
+
+    mask_to_number = Aggregator.mask_to_number
+
+    RSSI_MAX = Aggregator.RSSI_MAX
+    RSSI_MIN = Aggregator.RSSI_MIN
+
+    def __init__(self, run_root, node_ids, antenna_mask):
+        """
+        run_root should be a pathlib Path
+        """
+        self.run_root = run_root
+        self.node_ids = [int(id) for id in node_ids]
+        self.antenna_mask = antenna_mask
+        self.nb_antennas = self.mask_to_number[antenna_mask]
+        self.columns = self.nb_antennas + 1
+        nb_nodes = len(self.node_ids)
+        # node_id -> rank in node_ids, or -1
+        self.ranks = np.full(256, -1, dtype=np.int64)
+        self.ranks[self.node_ids] = np.arange(nb_nodes)
+        self.counts = np.zeros((nb_nodes, nb_nodes), dtype=np.int64)
+        # totals are sums of integers, so they remain exact as floats
+        self.totals = np.zeros((nb_nodes, nb_nodes, self.columns))
+
+    def fold(self, sender):
+        """
+        accumulates the contents of result-<sender>.txt
+        """
+        result_name = self.run_root / "result-{}.txt".format(sender)
+        self.fold_arrays(*load_result(result_name, self.columns))
+
+    def fold_arrays(self, senders, receivers, rssis):
+        """
+        accumulates frames, given as arrays like the ones
+        returned by load_result
+        """
+        nb_nodes = len(self.node_ids)
+        sender_ranks = self.ranks[senders]
+        receiver_ranks = self.ranks[receivers]
+        # ignore frames from or to nodes that are not in node_ids
+        known = (sender_ranks >= 0) & (receiver_ranks >= 0)
+        links = sender_ranks[known] * nb_nodes + receiver_ranks[known]
+        rssis = rssis[known]
+        size = nb_nodes * nb_nodes
+        self.counts += np.bincount(links, minlength=size)\
+            .reshape(nb_nodes, nb_nodes)
+        for column in range(self.columns):
+            self.totals[:, :, column] += np.bincount(
+                links, weights=rssis[:, column], minlength=size)\
+                .reshape(nb_nodes, nb_nodes)
+
+    def averages(self):
+        """
+        returns a [sender, receiver, column] array of averages;
+        links with no frame at all get RSSI_MAX on the diagonal
+        and RSSI_MIN elsewhere
+        """
+        nb_nodes = len(self.node_ids)
+        defaults = np.full((nb_nodes, nb_nodes), float(self.RSSI_MIN))
+        np.fill_diagonal(defaults, self.RSSI_MAX)
+        counts = self.counts[:, :, np.newaxis]
+        return np.where(counts > 0,
+                        self.totals / np.maximum(counts, 1),
+                        defaults[:, :, np.newaxis])
+
+    def run(self):
+        """
+        call at the end of one_run
+        """
+        for sender in self.node_ids:
+            self.fold(sender)
+        # consolidated file is called RSSI.txt
+        write_rssi(self.run_root / "RSSI.txt", self.node_ids, self.averages())
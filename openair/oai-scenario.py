@@ -12,6 +12,18 @@ from apssh.formatters import ColonFormatter
 
 # to be added to apssh
 from localjob import LocalJob
+from jobtimer import JobTimer, timing_name
+
+# how jobtimer groups jobs into phases, after their labels
+timing_phases = [
+    ("lease", "check we have a current lease"),
+    ("prepare", "turn off unused nodes|stop phone"),
+    ("load", "load and wait"),
+    ("services", "start (HSS|EPC|softmodem)"),
+    ("warm up", "wait for"),
+    ("phone", "start phone|ping phone"),
+    ("xterm", "xterm"),
+]
 
 def r2lab_hostname(x):
     """
@@ -351,7 +363,13 @@ def run(slice, hss, epc, enb, extras, load_nodes, image_gw, image_enb, image_ext
 
     sched.list()
 
-    if not sched.orchestrate():
+    timer = JobTimer(sched, phases = timing_phases)
+    ok = sched.orchestrate()
+    # where the time went
+    timer.save(timing_name)
+    print(timer.report())
+
+    if not ok:
         print("RUN KO : {}".format(sched.why()))
         sched.debrief()
         return False
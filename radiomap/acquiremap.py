@@ -6,17 +6,32 @@ See visumap.ipynb for how to use it
 """
 
 
+import sys
+import asyncio
+import tarfile
+from functools import partial
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-from asynciojobs import Scheduler, Sequence, PrintJob
+from asynciojobs import Scheduler, Sequence, PrintJob, Job, AbstractJob
 
 from apssh import SshNode, SshJob
 from apssh import Run, RunScript, Pull
 from apssh import TimeColonFormatter
 
 # helpers
-from processmap import Aggregator
+from processmap import IncrementalAggregator, reaggregate
+from pcapreader import process_pcap, process_encoded, capture_snaplen
+from pairscheduler import ping_rounds
+from connpool import ConnectionPool, default_lease_period
+from manifest import Manifest
+from jobtimer import JobTimer, timing_name
+from planner import CampaignPlan, load_history, config_order
+from simtestbed import SimTestbed
+from pathloss import SPACING
+import connpool
+import r2labmap
 from listofchoices import ListOfChoices
 from channels import channel_frequency
 
@@ -45,6 +60,20 @@ choices_channel      = list(channel_frequency.keys())
 default_channel      = 1
 
 
+# how jobtimer groups jobs into phases, after their labels
+timing_phases = [
+    ("connections", "check connections"),
+    ("lease", "check lease"),
+    ("load", "load images"),
+    ("init", "init "),
+    ("reconfigure", "reconfigure "),
+    ("tcpdump", "run tcpdump"),
+    ("settle", "settling"),
+    ("pings", "pings? "),
+    ("retrieve", "retrieve |extract "),
+    ("aggregate", "aggregate "),
+]
+
 # run on all nodes by default
 default_node_ids = list(range(1, 38))
 
@@ -87,11 +116,159 @@ def naming_scheme(run_name, tx_power, phy_rate, antenna_mask, channel,
     return run_root
 
 
+async def aggregate_node(aggregator, node_id, pcap_executor=None,
+                         record=None, decoder=process_pcap):
+    """
+    folds the results of one node into aggregator, once they have
+    been pulled; this runs in executors so that transfers
+    from other nodes can proceed meanwhile
+
+    if pcap_executor is provided, result-<N>.txt is first computed
+    with decoder - from the pcap file with pcapreader by default -
+    using that executor
+
+    if record is provided, it is called with node_id at the end,
+    typically to keep track of the node files in the manifest
+    """
+    loop = asyncio.get_event_loop()
+    if pcap_executor is not None:
+        await loop.run_in_executor(
+            pcap_executor, decoder, aggregator.run_root, node_id)
+    await loop.run_in_executor(None, aggregator.add, node_id)
+    if record is not None:
+        await loop.run_in_executor(None, record, node_id)
+
+
+class CallJob(AbstractJob):
+    """
+    a job that calls cofunction - typically a partial on a coroutine
+    function - only when it runs; unlike with Job, jobs that never
+    run do not leave behind coroutines that are never awaited
+    """
+
+    def __init__(self, cofunction, **kwds):
+        self.cofunction = cofunction
+        super().__init__(**kwds)
+
+    def text_label(self):
+        function = getattr(self.cofunction, 'func', self.cofunction)
+        return "CallJob[{}]".format(getattr(function, '__name__', '?'))
+
+    async def co_run(self):
+        return await self.cofunction()
+
+    async def co_shutdown(self):
+        pass
+
+
+def ping_tarname(node_id):
+    """
+    the archive where a source node gathers its PING files in batch mode
+    """
+    return "PING-{:02d}.tar".format(int(node_id))
+
+
+def extract_pings(run_root, node_id):
+    """
+    once pulled, expands the PING files of one source node in run_root
+    """
+    tarname = run_root / ping_tarname(node_id)
+    with tarfile.open(str(tarname)) as archive:
+        archive.extractall(str(run_root))
+    tarname.unlink()
+
+
+async def extract_node_pings(run_root, node_id):
+    """
+    same as extract_pings, in an executor
+    """
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, extract_pings, run_root, node_id)
+
+
+def retrieve_jobs(scheduler, node_index, run_root, required, local_pcap,
+                  compact=False, keep_connection=False, verbose_jobs=False):
+    """
+    the jobs that stop tcpdump on the nodes in node_index, and pull
+    their pcap files - and result-<N>.txt unless local_pcap is set -
+    into run_root; returns them in the order of node_index
+
+    with compact, the pcap file is encoded on the node with pcapreader,
+    and only the resulting fit<N>.rssi.gz is pulled
+    """
+    if compact:
+        retrieve_tcpdump = [
+            SshJob(
+                scheduler=scheduler,
+                node=nodei,
+                keep_connection=keep_connection,
+                required=required,
+                label="retrieve compact capture from fit{:02d}".format(i),
+                verbose=verbose_jobs,
+                commands=[
+                    Run("sleep 1;pkill tcpdump; sleep 1"),
+                    RunScript("pcapreader.py", "--encode",
+                              "/tmp/fit{}.pcap".format(i),
+                              "/tmp/fit{}.rssi.gz".format(i),
+                              "--dst", "10.0.0.{}".format(i)),
+                    Pull(remotepaths=["/tmp/fit{}.rssi.gz".format(i)],
+                         localpath=str(run_root)),
+                ]
+            )
+            for i, nodei in node_index.items()
+        ]
+    elif local_pcap:
+        # result-<N>.txt will be computed here by pcapreader
+        retrieve_tcpdump = [
+            SshJob(
+                scheduler=scheduler,
+                node=nodei,
+                keep_connection=keep_connection,
+                required=required,
+                label="retrieve pcap trace from fit{:02d}".format(i),
+                verbose=verbose_jobs,
+                commands=[
+                    Run("sleep 1;pkill tcpdump; sleep 1"),
+                    Run("echo retrieving pcap trace from fit{:02d}".format(i)),
+                    Pull(remotepaths=["/tmp/fit{}.pcap".format(i)],
+                         localpath=str(run_root)),
+                ]
+            )
+            for i, nodei in node_index.items()
+        ]
+    else:
+        retrieve_tcpdump = [
+            SshJob(
+                scheduler=scheduler,
+                node=nodei,
+                keep_connection=keep_connection,
+                required=required,
+                label="retrieve pcap trace from fit{:02d}".format(i),
+                verbose=verbose_jobs,
+                commands=[
+                    Run("sleep 1;pkill tcpdump; sleep 1"),
+                    RunScript("node-utilities.sh", "process-pcap", i),
+                    Run(
+                        "echo retrieving pcap trace and result-{i}.txt from fit{i:02d}".format(i=i)),
+                    Pull(remotepaths=["/tmp/fit{}.pcap".format(i),
+                                      "/tmp/result-{}.txt".format(i)],
+                         localpath=str(run_root)),
+                ]
+            )
+            for i, nodei in node_index.items()
+        ]
+    return retrieve_tcpdump
+
+
 def one_run(wireless_driver, 
             tx_power, phy_rate, antenna_mask, channel, *,
             run_name=default_run_name, slicename=default_slicename,
             load_images=False, node_ids=None,
-            parallel=None,
+            parallel=None, rounds=False, rounds_reference=None,
+            batch=False, local_pcap=False, compact=False,
+            statistics=False, keep_samples=False,
+            previous_config=None, pool=None, manifest=None,
+            pcap_executor=None,
             verbose_ssh=False, verbose_jobs=False, dry_run=False):
     """
     Performs data acquisition on all nodes with the following settings
@@ -111,6 +288,39 @@ def one_run(wireless_driver,
         parallel: a number of simulataneous jobs to run
                   1 means all data acquisition is sequential (default)
                   0 means maximum parallel
+        rounds: if set, pings are grouped in rounds of pairs that are far
+                  enough apart not to interfere, see pairscheduler;
+                  pings in one round run concurrently, and rounds
+                  run one after the other; parallel is then ignored
+        rounds_reference: an optional RSSI.txt file from a previous run,
+                  used by pairscheduler to spot nodes that interfere
+        batch: if set, there is one ping job per source node, that pings
+                  all its destinations in turn, and whose outputs are
+                  pulled at once in a tar file; this means one ssh session,
+                  script upload and transfer per node, instead of per pair
+        local_pcap: if set, pcap files are processed on this laptop
+                  with pcapreader, rather than with tshark on the nodes
+        compact: if set, tcpdump only captures the headers of ICMP frames,
+                  and the pcap files are reduced on the nodes into
+                  compact records, that are decoded here; this takes
+                  precedence over local_pcap
+        statistics: if set, per-link statistics beyond the averages
+                  are saved in RSSI-stats.txt, see processmap.LinkStatistics
+        keep_samples: if set, all individual rssi values are saved
+                  in RSSI-samples.npz, see samplestore
+        previous_config: if set, the nodes are expected to be already
+                  configured with this (tx_power, phy_rate, antenna_mask,
+                  channel) tuple, and only the settings that differ
+                  are changed, with reconfigure-ad-hoc-network
+        pool: an optional connpool.ConnectionPool, whose connections
+                  are used and left open; slicename and verbose_ssh
+                  are then ignored, and the lease only gets checked
+                  once in a while
+        manifest: an optional manifest.Manifest instance, where
+                  progress and checksums are recorded
+        pcap_executor: an optional ProcessPoolExecutor where pcap files
+                  are decoded with local_pcap or compact, and that is
+                  left running; one is created for this config otherwise
     """
 
     #
@@ -127,6 +337,9 @@ def one_run(wireless_driver,
         # in dry-run mode we are done
         return True
 
+    if rounds and batch:
+        raise ValueError("rounds need one ping job per pair, not batch")
+
     # set default for the nodes parameter
     node_ids = [int(id)
                 for id in node_ids] if node_ids is not None else default_node_ids
@@ -135,28 +348,54 @@ def one_run(wireless_driver,
     # create the logs directory based on input parameters
     run_root = naming_scheme(run_name, tx_power, phy_rate,
                              antenna_mask, channel, autocreate=True)
+    config = (tx_power, phy_rate, antenna_mask, channel)
+    if manifest is not None:
+        manifest.start(config, node_ids)
+        record = partial(manifest.record_node, config, run_root)
+    else:
+        record = None
 
     # the nodes involved
-    faraday = SshNode(hostname=default_gateway, username=slicename,
-                      formatter=TimeColonFormatter(), verbose=verbose_ssh)
+    if pool is None:
+        faraday = SshNode(hostname=default_gateway, username=slicename,
+                          formatter=TimeColonFormatter(), verbose=verbose_ssh)
 
-    # this is a python dictionary that allows to retrieve a node object
-    # from an id
-    node_index = {
-        id: SshNode(gateway=faraday, hostname=fitname(id), username="root",
-                    formatter=TimeColonFormatter(), verbose=verbose_ssh)
-        for id in node_ids
-    }
+        # this is a python dictionary that allows to retrieve a node object
+        # from an id
+        node_index = {
+            id: SshNode(gateway=faraday, hostname=fitname(id), username="root",
+                        formatter=TimeColonFormatter(), verbose=verbose_ssh)
+            for id in node_ids
+        }
+    else:
+        faraday = pool.gateway
+        node_index = {id: pool.node(id, fitname(id)) for id in node_ids}
+    # jobs must not close connections that the pool will reuse
+    keep_connection = pool is not None
 
     # the global scheduler
     scheduler = Scheduler(verbose=verbose_jobs)
 
     ##########
-    check_lease = SshJob(
+    if pool is not None:
+        # nodes are about to reboot if we load images
+        connections = Job(
+            pool.co_prepare([] if load_images else node_ids),
+            scheduler=scheduler,
+            critical=True,
+            label="check connections")
+    else:
+        connections = None
+    # no need to check the lease at every config
+    check_lease_due = pool is None or pool.lease_check_due()
+    check_lease = connections if not check_lease_due else SshJob(
+        required=connections,
         scheduler=scheduler,
         node=faraday,
+        keep_connection=keep_connection,
         verbose=verbose_jobs,
         critical=True,
+        label="check lease",
         command=Run("rhubarbe leases --check"),
     )
 
@@ -172,10 +411,12 @@ def one_run(wireless_driver,
         # replace green_light in this case
         green_light = SshJob(
             node=faraday,
+            keep_connection=keep_connection,
             required=check_lease,
             critical=True,
             scheduler=scheduler,
             verbose=verbose_jobs,
+            label="load images",
             commands=[
                 Run("rhubarbe", "off", "-a", *negated_node_ids),
                 Run("rhubarbe", "load", "-i", "u16-radiomap", *node_ids),
@@ -196,31 +437,56 @@ def one_run(wireless_driver,
     frequency = channel_frequency[int(channel)]
     # tx_power_in_mBm not in dBm
     tx_power_driver = tx_power * 100
+    # no need to install tshark if we process pcaps ourselves
+    tshark = "no-tshark" if local_pcap or compact else "tshark"
+    if previous_config is None or load_images:
+        init_command = RunScript(
+            "node-utilities.sh", "init-ad-hoc-network",
+            wireless_driver, "foobar", frequency, phy_rate, 
+            antenna_mask, tx_power_driver, tshark
+        )
+    else:
+        # only apply what differs from the previous config
+        changes = [
+            name for name, before, after in zip(
+                ("txpower", "phyrate", "antmask", "freq"), previous_config,
+                (tx_power, phy_rate, antenna_mask, channel))
+            if before != after
+        ]
+        init_command = RunScript(
+            "node-utilities.sh", "reconfigure-ad-hoc-network",
+            wireless_driver, "foobar", frequency, phy_rate,
+            antenna_mask, tx_power_driver, *changes
+        )
     init_wireless_jobs = [
         SshJob(
             scheduler=scheduler,
             required=green_light,
             node=node,
+            keep_connection=keep_connection,
             verbose=verbose_jobs,
-            label="init {}".format(id),
-            command=RunScript(
-                "node-utilities.sh", "init-ad-hoc-network",
-                wireless_driver, "foobar", frequency, phy_rate, 
-                antenna_mask, tx_power_driver
-            ))
+            label="{} {}".format(
+                "init" if previous_config is None or load_images
+                else "reconfigure", id),
+            command=init_command)
         for id, node in node_index.items()]
 
     # then run tcpdump on fit nodes, this job never ends...
+    # in compact mode, only the headers of ICMP frames for that node
+    tcpdump_filter = " -s {} icmp and dst host 10.0.0.{{}}"\
+        .format(capture_snaplen) if compact else ""
     run_tcpdump = [
         SshJob(
             scheduler=scheduler,
             node=node,
+            keep_connection=keep_connection,
             required=init_wireless_jobs,
             label="run tcpdump on fit nodes",
             verbose=verbose_jobs,
             commands=[
                 Run("echo run tcpdump on fit{:02d}".format(i)),
-                Run("tcpdump -U -i moni-{} -y ieee802_11_radio -w /tmp/fit{}.pcap".format(wireless_driver, i))
+                Run("tcpdump -U -i moni-{} -y ieee802_11_radio -w /tmp/fit{}.pcap".format(wireless_driver, i)
+                    + tcpdump_filter.format(i))
             ]
         )
         for i, node in node_index.items()
@@ -243,54 +509,110 @@ def one_run(wireless_driver,
     # to the scheduler, we will add them later on
     # depending on the sequential/parallel strategy
 
-    pings = [
-        SshJob(
-            node=nodei,
-            required=settle_wireless_job,
-            label="ping {} -> {}".format(i, j),
-            verbose=verbose_jobs,
-            commands=[
-                Run("echo {} '->' {}".format(i, j)),
-                RunScript("node-utilities.sh", "my-ping",
-                          "10.0.0.{}".format(j), ping_timeout, ping_interval,
-                          ping_size, ping_number,
-                          ">", "PING-{:02d}-{:02d}".format(i, j)),
-                Pull(remotepaths="PING-{:02d}-{:02d}".format(i, j),
-                     localpath=str(run_root)),
-            ]
-        )
-        # looping on the source
-        for i, nodei in node_index.items()
-        # and on the destination
-        for j, nodej in node_index.items()
-        # and keep only half of the couples
-        if j > i
-    ]
+    if not batch:
+        pings = [
+            SshJob(
+                node=nodei,
+                keep_connection=keep_connection,
+                required=settle_wireless_job,
+                label="ping {} -> {}".format(i, j),
+                verbose=verbose_jobs,
+                commands=[
+                    Run("echo {} '->' {}".format(i, j)),
+                    RunScript("node-utilities.sh", "my-ping",
+                              "10.0.0.{}".format(j), ping_timeout, ping_interval,
+                              ping_size, ping_number,
+                              ">", "PING-{:02d}-{:02d}".format(i, j)),
+                    Pull(remotepaths="PING-{:02d}-{:02d}".format(i, j),
+                         localpath=str(run_root)),
+                ]
+            )
+            # looping on the source
+            for i, nodei in node_index.items()
+            # and on the destination
+            for j, nodej in node_index.items()
+            # and keep only half of the couples
+            if j > i
+        ]
+        # same order as above
+        ping_by_pair = dict(zip(
+            ((i, j) for i in node_index for j in node_index if j > i),
+            pings))
+    else:
+        # one job per source node, that pings the same destinations
+        # as above, and whose outputs come back in a single archive
+        destinations = {
+            i: [j for j in node_index if j > i]
+            for i in node_index
+        }
+        # the last node has no destination left
+        sources = [i for i in node_index if destinations[i]]
+        pings = [
+            SshJob(
+                node=node_index[i],
+                keep_connection=keep_connection,
+                required=settle_wireless_job,
+                label="pings from {}".format(i),
+                verbose=verbose_jobs,
+                commands=[
+                    RunScript("node-utilities.sh", "my-ping-all",
+                              i, ping_tarname(i), ping_timeout, ping_interval,
+                              ping_size, ping_number, *destinations[i]),
+                    Pull(remotepaths=ping_tarname(i),
+                         localpath=str(run_root)),
+                ]
+            )
+            for i in sources
+        ]
+        # expanding the archives is not part of the Sequence below
+        extract_jobs = [
+            CallJob(partial(extract_node_pings, run_root, i),
+                    scheduler=scheduler,
+                    required=ping_job,
+                    label="extract pings from fit{:02d}".format(i))
+            for i, ping_job in zip(sources, pings)
+        ]
 
     # retrieve all pcap files from fit nodes
-    retrieve_tcpdump = [
-        SshJob(
-            scheduler=scheduler,
-            node=nodei,
-            required=pings,
-            label="retrieve pcap trace from fit{:02d}".format(i),
-            verbose=verbose_jobs,
-            commands=[
-                Run("sleep 1;pkill tcpdump; sleep 1"),
-                RunScript("node-utilities.sh", "process-pcap", i),
-                Run(
-                    "echo retrieving pcap trace and result-{i}.txt from fit{i:02d}".format(i=i)),
-                Pull(remotepaths=["/tmp/fit{}.pcap".format(i),
-                                  "/tmp/result-{}.txt".format(i)],
-                     localpath=str(run_root)),
-            ]
-        )
-        for i, nodei in node_index.items()
+    retrieve_tcpdump = retrieve_jobs(
+        scheduler, node_index, run_root, pings, local_pcap, compact,
+        keep_connection=keep_connection, verbose_jobs=verbose_jobs)
+
+    # aggregate results as soon as each node is done
+    # a partial RSSI file is published in run_root along the way
+    aggregator = IncrementalAggregator(
+        run_root, node_ids, antenna_mask, wireless_driver,
+        statistics=statistics, samples=keep_samples)
+    # all_runs shares one executor between all configs
+    own_executor = pcap_executor is None and (local_pcap or compact)
+    if own_executor:
+        pcap_executor = ProcessPoolExecutor()
+    elif not (local_pcap or compact):
+        pcap_executor = None
+    decoder = process_encoded if compact else process_pcap
+    aggregate_jobs = [
+        CallJob(partial(aggregate_node, aggregator, i, pcap_executor,
+                        record, decoder),
+                scheduler=scheduler,
+                required=retrieve_job,
+                label="aggregate results from fit{:02d}".format(i))
+        for i, retrieve_job in zip(node_index, retrieve_tcpdump)
     ]
 
     # xxx this is a little fishy
     # should we not just consider that the default is parallel=1 ?
-    if parallel is None:
+    if rounds:
+        # each round requires the previous one to be complete
+        previous = settle_wireless_job
+        for pairs in ping_rounds(node_ids, reference=rounds_reference):
+            round_jobs = [ping_by_pair[pair] for pair in pairs]
+            for job in round_jobs:
+                job.requires(previous)
+            scheduler.update(round_jobs)
+            previous = round_jobs
+        # the required graph is what limits concurrency
+        jobs_window = None
+    elif parallel is None:
         # with the sequential strategy, we just need to
         # create a Sequence out of the list of pings
         # Sequence will add the required relationships
@@ -309,22 +631,169 @@ def one_run(wireless_driver,
         jobs_window = parallel
 
     # if not in dry-run mode, let's proceed to the actual experiment
+    timer = JobTimer(scheduler, phases=timing_phases)
     ok = scheduler.orchestrate(jobs_window=jobs_window)
+    # where the time went
+    timer.save(run_root / timing_name)
+    print(timer.report())
+    if ok and pool is not None and check_lease_due:
+        pool.lease_checked()
+    if own_executor:
+        pcap_executor.shutdown()
     # give details if it failed
     if not ok:
         scheduler.debrief()
 
-    # data acquisition is done, let's aggregate results
-    # i.e. compute averages
+    # data acquisition is done, most of the aggregation too
+    # this only writes RSSI.txt from the averages
     if ok:
-        post_processor = Aggregator(run_root, node_ids, antenna_mask, wireless_driver)
-        post_processor.run()
+        aggregator.run()
+    if manifest is not None:
+        manifest.finish(config, ok, run_root)
 
     return ok
 
 
+def retrieve_run(wireless_driver, tx_power, phy_rate, antenna_mask, channel,
+                 retrieve_ids, *, pool, manifest, run_name=default_run_name,
+                 node_ids=None, local_pcap=False, compact=False,
+                 statistics=False, keep_samples=False, pcap_executor=None,
+                 verbose_jobs=False):
+    """
+    completes a config whose pings were done, but whose files could not
+    all be pulled - see Manifest.can_repull; only the nodes in
+    retrieve_ids are pulled again, and RSSI.txt is recomputed from
+    the result files of all nodes
+
+    Arguments:
+        retrieve_ids: the nodes to pull files from
+        pool: a connpool.ConnectionPool
+        manifest: a manifest.Manifest instance
+        others: same as in one_run
+    """
+    node_ids = [int(id)
+                for id in node_ids] if node_ids is not None else default_node_ids
+    run_root = naming_scheme(run_name, tx_power, phy_rate,
+                             antenna_mask, channel, autocreate=True)
+    config = (tx_power, phy_rate, antenna_mask, channel)
+    record = partial(manifest.record_node, config, run_root)
+
+    scheduler = Scheduler(verbose=verbose_jobs)
+    connections = Job(
+        pool.co_prepare(retrieve_ids),
+        scheduler=scheduler,
+        critical=True,
+        label="check connections")
+    node_index = {id: pool.node(id, fitname(id)) for id in retrieve_ids}
+    retrieve_tcpdump = retrieve_jobs(
+        scheduler, node_index, run_root, connections, local_pcap, compact,
+        keep_connection=True, verbose_jobs=verbose_jobs)
+
+    # the nodes that are not retrieved again are folded from disk
+    # by aggregator.run()
+    aggregator = IncrementalAggregator(
+        run_root, node_ids, antenna_mask, wireless_driver,
+        statistics=statistics, samples=keep_samples)
+    # all_runs shares one executor between all configs
+    own_executor = pcap_executor is None and (local_pcap or compact)
+    if own_executor:
+        pcap_executor = ProcessPoolExecutor()
+    elif not (local_pcap or compact):
+        pcap_executor = None
+    decoder = process_encoded if compact else process_pcap
+    aggregate_jobs = [
+        CallJob(partial(aggregate_node, aggregator, i, pcap_executor,
+                        record, decoder),
+                scheduler=scheduler,
+                required=retrieve_job,
+                label="aggregate results from fit{:02d}".format(i))
+        for i, retrieve_job in zip(node_index, retrieve_tcpdump)
+    ]
+
+    ok = scheduler.orchestrate()
+    if own_executor:
+        pcap_executor.shutdown()
+    if not ok:
+        scheduler.debrief()
+    if ok:
+        aggregator.run()
+    manifest.finish(config, ok, run_root)
+    return ok
+
+
+def resume_run(wireless_driver, tx_power, phy_rate, antenna_mask, channel,
+               manifest, pool, **kwds):
+    """
+    tries and complete a config from what a previous attempt left behind
+    kwds are the ones passed to one_run
+
+    Returns:
+        True if the config is complete, False if it needs a full run
+    """
+    config = (tx_power, phy_rate, antenna_mask, channel)
+    run_root = naming_scheme(kwds.get('run_name', default_run_name), *config)
+    if manifest.is_complete(config, run_root):
+        print("{}: complete, skipped".format(run_root))
+        return True
+    missing = manifest.missing_nodes(config, run_root)
+    if missing is None:
+        return False
+    # all node files are there, RSSI.txt is missing or corrupt
+    if not missing:
+        print("{}: aggregating again".format(run_root))
+        reaggregate(run_root, antenna_mask, wireless_driver,
+                    statistics=kwds.get('statistics', False),
+                    samples=kwds.get('keep_samples', False))
+        manifest.finish(config, True, run_root)
+        return True
+    # the pcap files may still be on the nodes
+    if manifest.can_repull(config) and pool is not None \
+            and not kwds.get('dry_run'):
+        print("{}: pulling again from nodes {}"
+              .format(run_root, " ".join(str(id) for id in missing)))
+        return retrieve_run(
+            wireless_driver, tx_power, phy_rate, antenna_mask, channel,
+            missing, pool=pool, manifest=manifest,
+            **{key: kwds[key] for key in ('run_name', 'node_ids', 'local_pcap',
+                                          'compact', 'statistics',
+                                          'keep_samples', 'pcap_executor',
+                                          'verbose_jobs')
+               if key in kwds})
+    return False
+
+
+def campaign_plan(configs, *, run_name=default_run_name, node_ids=None,
+                  load_images=False, parallel=None, rounds=False,
+                  rounds_reference=None, batch=False, reconfigure=False,
+                  keep_connections=True, history=(),
+                  **kwds):                      # pylint: disable=w0613
+    """
+    the CampaignPlan for configs, based on the timings of previous
+    configs in run_name and in the history runs; the other
+    arguments are the ones of all_runs
+    """
+    history_runs = [run_name] + list(history)
+    durations, nb_configs = load_history(history_runs, ping_timeout,
+                                         ping_number, ping_interval)
+    if nb_configs:
+        print("history: timings of {} config(s) in {}"
+              .format(nb_configs, " ".join(history_runs)))
+    else:
+        print("history: none found, using default durations")
+    return CampaignPlan(
+        configs, node_ids if node_ids is not None else default_node_ids,
+        history=durations, settle_delay=settle_delay,
+        ping_timeout=ping_timeout, ping_number=ping_number,
+        ping_interval=ping_interval, load_images=load_images,
+        reconfigure=reconfigure, parallel=parallel, rounds=rounds,
+        rounds_reference=rounds_reference, batch=batch,
+        lease_period=default_lease_period if keep_connections else None)
+
+
 def all_runs(wireless_driver,
-             tx_powers, phy_rates, antenna_masks, channels, *args, **kwds):
+             tx_powers, phy_rates, antenna_masks, channels, *args,
+             reconfigure=False, keep_connections=True, resume=False,
+             history=(), **kwds):
     """
     calls one_run with the cartesian product of
     tx_powers, phy_rates, antenna_masks and channels, that are expected to
@@ -332,6 +801,24 @@ def all_runs(wireless_driver,
 
     All other arguments to one_run may/must be specified as well
 
+    If reconfigure is set, only the first config does a full
+    init-ad-hoc-network; the following ones only change the settings
+    that differ from the previous config - unless that one failed
+
+    If keep_connections is set, all configs share the same ssh
+    connections, see connpool
+
+    Progress is recorded in <run_name>/manifest.json; if resume is set,
+    configs that are complete are skipped, and the other ones are
+    completed from what is left if possible, see resume_run
+
+    With reconfigure, configs are reordered so that the ones with the
+    same channel and antenna mask come together, see planner
+
+    In dry-run mode, nothing runs and the estimated duration of each
+    config is printed instead, see campaign_plan; history is a list
+    of other runs whose timings are used, in addition to run_name
+
     Example:
         all_runs([5, 14], [1], [1], [1, 40], ...)
         will call one_run exactly 4 times
@@ -345,20 +832,86 @@ def all_runs(wireless_driver,
     if wireless_driver == "iwlwifi":
         antenna_masks = [1]
 
+    configs = [
+        (tx_power, phy_rate, antenna_mask, channel)
+        for tx_power in tx_powers
+        for phy_rate in phy_rates
+        for antenna_mask in antenna_masks
+        for channel in channels
+    ]
+    if reconfigure:
+        # leaving and joining the cell again is what takes time
+        configs = config_order(configs)
+
+    if kwds.get('dry_run'):
+        plan = campaign_plan(configs, reconfigure=reconfigure,
+                             keep_connections=keep_connections,
+                             history=history, **kwds)
+        print(plan.report())
+        return True
+
+    pool = None
+    if keep_connections:
+        pool = ConnectionPool(default_gateway,
+                              kwds.get('slicename', default_slicename),
+                              verbose=kwds.get('verbose_ssh', False))
+
+    manifest = Manifest(kwds.get('run_name', default_run_name))
+
+    # one process pool for decoding the pcap files of all configs
+    own_executor = kwds.get('pcap_executor') is None \
+        and (kwds.get('local_pcap') or kwds.get('compact'))
+    if own_executor:
+        kwds['pcap_executor'] = ProcessPoolExecutor()
+
     overall = True
-    for tx_power in tx_powers:
-        for phy_rate in phy_rates:
-            for antenna_mask in antenna_masks:
-                for channel in channels:
-                    # record any failure
-                    if not one_run(wireless_driver, tx_power, phy_rate, antenna_mask,
-                                   channel, *args, **kwds):
-                        overall = False
-                    # make sure images will get loaded only once
-                    kwds['load_images'] = False
+    # the config the nodes are known to be in
+    previous_config = None
+    # the last config started is the only one whose files may still be
+    # on the nodes, so it needs be completed before any other config runs;
+    # it is tried only once, whatever the outcome
+    last, resumed = None, False
+    if resume:
+        last = manifest.last_config()
+        if last in configs:
+            resumed = resume_run(wireless_driver, *last, manifest, pool,
+                                 **kwds)
+    for config in configs:
+        if resume and config == last:
+            if resumed:
+                continue
+        elif resume and resume_run(
+                wireless_driver, *config, manifest, pool, **kwds):
+            continue
+        # record any failure
+        if one_run(wireless_driver, *config, *args,
+                   previous_config=previous_config,
+                   pool=pool, manifest=manifest, **kwds):
+            if reconfigure:
+                previous_config = config
+        else:
+            overall = False
+            # state of the nodes is unknown, start afresh
+            previous_config = None
+        # make sure images will get loaded only once
+        kwds['load_images'] = False
+    if own_executor:
+        kwds['pcap_executor'].shutdown()
+    if pool is not None:
+        pool.close()
+        print(pool.summary())
     return overall
 
 
+def simulated_testbed():
+    """
+    a SimTestbed with the 37 nodes at their r2labmap positions
+    """
+    node_to_position, _, _ = r2labmap.maps(lambda x: x, lambda y: y)
+    return SimTestbed({node_id: (SPACING * x, SPACING * y)
+                       for node_id, (x, y) in node_to_position.items()})
+
+
 def main():
     """
     Command-line frontend - offers primarily all options to all_runs
@@ -408,6 +961,35 @@ def main():
                         help="""run in parallel, with this value as the
                         limit to the number of simultaneous pings - default is sequential;
                         -p 0 means no limit""")
+    parser.add_argument("-R", "--rounds", default=False, action='store_true',
+                        help="run pings in rounds of pairs that do not"
+                        " interfere with each other, see pairscheduler")
+    parser.add_argument("--rounds-reference", default=None,
+                        help="a RSSI.txt file from a previous run, to spot"
+                        " nodes that interfere in rounds mode")
+    parser.add_argument("--fresh-connections", default=False,
+                        action='store_true',
+                        help="use new ssh connections for each config,"
+                        " instead of keeping them open for the whole campaign")
+    parser.add_argument("--resume", default=False, action='store_true',
+                        help="skip the configs that are complete in the"
+                        " manifest, and complete the other ones if possible")
+    parser.add_argument("--reconfigure", default=False, action='store_true',
+                        help="between configs, only change the wireless"
+                        " settings that differ, instead of a full init")
+    parser.add_argument("-b", "--batch", default=False, action='store_true',
+                        help="run one ping job per source node, instead of"
+                        " one per pair of nodes")
+    parser.add_argument("-L", "--local-pcap", default=False, action='store_true',
+                        help="process pcap files locally with pcapreader,"
+                        " instead of running tshark on the nodes")
+    parser.add_argument("-C", "--compact", default=False, action='store_true',
+                        help="capture headers only, and encode captures"
+                        " on the nodes before pulling them")
+    parser.add_argument("--statistics", default=False, action='store_true',
+                        help="save per-link statistics in RSSI-stats.txt")
+    parser.add_argument("-k", "--keep-samples", default=False, action='store_true',
+                        help="save all individual rssi values in RSSI-samples.npz")
     # parser.add_argument("-T", "--ping-timeout", default=ping_timeout,
     #                    help="timeout for each individual ping")
     # parser.add_argument("-I", "--ping-interval", default=ping_interval,
@@ -417,17 +999,28 @@ def main():
     # parser.add_argument("-N", "--ping-number", default=ping_number,
     #                    help="specify number of ping packets to send")
 
+    parser.add_argument("--simulate", default=False, action='store_true',
+                        help="run on virtual nodes, with no access to the testbed;"
+                        " see simtestbed.py")
+
     parser.add_argument("-n", "--dry-run", default=False, action='store_true',
-                        help="do not run anything, just print out scheduler,"
-                        " and generate .dot file")
+                        help="do not run anything, just print out the estimated"
+                        " duration of each config, see planner.py")
+    parser.add_argument("--history", default=[], action='append',
+                        help="in dry-run mode, another run whose timings are"
+                        " used for the estimates; can be repeated")
     parser.add_argument("-v", "--verbose-ssh", default=False, action='store_true',
                         help="run ssh in verbose mode")
     parser.add_argument("-d", "--debug", default=False, action='store_true',
                         help="run jobs and engine in verbose mode")
     args = parser.parse_args()
 
+    if args.simulate:
+        testbed = simulated_testbed()
+        testbed.install(sys.modules[__name__], connpool)
+
     # run the experiment on all specified input values
-    return all_runs(tx_powers=args.tx_powers, phy_rates=args.phy_rates,
+    ok = all_runs(tx_powers=args.tx_powers, phy_rates=args.phy_rates,
                     antenna_masks=args.antenna_masks, channels=args.channels,
                     run_name=args.run_name,
                     slicename=args.slicename,
@@ -436,13 +1029,27 @@ def main():
                     verbose_ssh=args.verbose_ssh,
                     verbose_jobs=args.debug,
                     parallel=args.parallel,
+                    rounds=args.rounds,
+                    rounds_reference=args.rounds_reference,
+                    batch=args.batch,
+                    reconfigure=args.reconfigure,
+                    resume=args.resume,
+                    keep_connections=not args.fresh_connections,
+                    local_pcap=args.local_pcap,
+                    compact=args.compact,
+                    statistics=args.statistics,
+                    keep_samples=args.keep_samples,
                     dry_run=args.dry_run,
+                    history=args.history,
                     wireless_driver=args.wifi_driver
                     # ping_timeout = args.ping_timeout
                     # ping_interval = args.ping_interval
                     # ping_size = args.ping_size
                     # ping_number = args.ping_number
                    )
+    if args.simulate:
+        testbed.cleanup()
+    return ok
 
 
 ##########
@@ -0,0 +1,118 @@
+"""
+A single plotly figure that animates a radiomap along one axis
+
+Rather than calling radiomap2D once for each value of, say, the sender,
+which means one kernel round trip and one full figure each time,
+we build one figure with one plotly frame per value of the sweep axis;
+scrubbing through frames is then done in the browser
+
+Values are read from the memory-mapped runstore, and only for the
+selected slice; they are quantized so that the figure size remains
+reasonable
+"""
+
+import numpy as np
+
+import plotly.graph_objs as go
+
+from runstore import open_store
+from r2labplotly import rssi_array_to_plotly3D
+
+# the axes that can be swept
+sweep_axes = ('sender', 'tx_power', 'antenna_mask', 'channel')
+
+
+def quantize(Z, step):
+    """
+    rounds Z to multiples of step, so that the JSON payload is short,
+    and returns nested lists, with None instead of NaN
+    """
+    missing = np.isnan(Z)
+    quantized = np.round(np.where(missing, 0, Z) / step) * step
+    if float(step).is_integer():
+        quantized = quantized.astype(int)
+    quantized = quantized.astype(object)
+    quantized[missing] = None
+    return quantized.tolist()
+
+
+def sweep_frames(store, sweep, settings, rssi_rank):
+    """
+    a generator of (value, Z) for each value of the sweep axis,
+    where Z is a (5, 9) grid; settings holds the fixed values
+    of the other axes
+    """
+    node_ids = store.node_ids
+    if sweep == 'sender':
+        matrix = store.matrix(settings['tx_power'], settings['phy_rate'],
+                              settings['antenna_mask'], settings['channel'])
+        # all senders at once
+        Zs = rssi_array_to_plotly3D(matrix[:, :, rssi_rank], node_ids)
+        yield from zip(node_ids, Zs)
+        return
+    sender = store.node_index(settings['sender'])
+    for value in store.axes[sweep]:
+        config = dict(settings, **{sweep: value})
+        config = (config['tx_power'], config['phy_rate'],
+                  config['antenna_mask'], config['channel'])
+        if config not in store.details:
+            continue
+        values = store.matrix(*config)[sender, :, rssi_rank]
+        yield value, rssi_array_to_plotly3D(values, node_ids)
+
+
+def animated_radiomap(run_name, sweep='sender', *, sender=1, tx_power=14,
+                      phy_rate=1, antenna_mask=7, channel=1, rssi_rank=0,
+                      step=1):
+    """
+    builds a plotly Figure with one frame for each value of *sweep*
+    which must be one of sweep_axes; the other settings are fixed
+
+    Parameters:
+        run_name: a run directory, typically 'datasample'
+        step: values are rounded to multiples of step dBm
+
+    Returns:
+        a plotly Figure, e.g. for plotly.offline.iplot
+    """
+    if sweep not in sweep_axes:
+        raise ValueError("cannot sweep along {}".format(sweep))
+    store = open_store(run_name)
+    settings = dict(sender=sender, tx_power=tx_power, phy_rate=phy_rate,
+                    antenna_mask=antenna_mask, channel=channel)
+    frames, steps = [], []
+    for value, Z in sweep_frames(store, sweep, settings, rssi_rank):
+        name = str(value)
+        frames.append(go.Frame(
+            name=name,
+            data=[go.Heatmap(z=quantize(Z, step))]))
+        steps.append(dict(
+            label=name, method='animate',
+            args=[[name], dict(mode='immediate', frame=dict(duration=0),
+                               transition=dict(duration=0))]))
+    if not frames:
+        raise ValueError("no data in {} for these settings".format(run_name))
+
+    x = list(range(1, Z.shape[1] + 1))
+    y = list(range(1, Z.shape[0] + 1))
+    heatmap = go.Heatmap(x=x, y=y, z=frames[0].data[0].z,
+                         zmin=-100, zmax=0, zauto=False)
+    fixed = " ".join("{}={}".format(k, v) for k, v in settings.items()
+                     if k != sweep)
+    layout = go.Layout(
+        title="R2lab Radio-Map: Rx power (in dBm) vs {}<br>{} - {}"
+        .format(sweep, run_name, fixed),
+        updatemenus=[dict(
+            type='buttons', showactive=False,
+            buttons=[
+                dict(label='Play', method='animate',
+                     args=[None, dict(frame=dict(duration=500),
+                                      fromcurrent=True)]),
+                dict(label='Pause', method='animate',
+                     args=[[None], dict(mode='immediate',
+                                        frame=dict(duration=0))]),
+            ])],
+        sliders=[dict(currentvalue=dict(prefix="{}: ".format(sweep)),
+                      steps=steps)],
+    )
+    return go.Figure(data=[heatmap], layout=layout, frames=frames)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""
+Compares the pure python Aggregator and the numpy-based ArrayAggregator
+from processmap.py on synthetic result files
+
+Both must produce the very same RSSI.txt
+"""
+
+import random
+import time
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from processmap import Aggregator, ArrayAggregator
+
+
+def make_results(run_root, node_ids, frames, antenna_mask, wireless_driver):
+    """
+    creates one result-<N>.txt file for each node, in which
+    each other node shows up with *frames* lines
+    """
+    nb_antennas = Aggregator.mask_to_number[antenna_mask] \
+        if wireless_driver == 'ath9k' else 0
+    for receiver in node_ids:
+        result_name = run_root / "result-{}.txt".format(receiver)
+        with result_name.open("w") as result_file:
+            for sender in node_ids:
+                if sender == receiver:
+                    continue
+                # one mean value per link, and some noise around it
+                mean = random.randint(-95, -30)
+                for _ in range(frames):
+                    rssis = [mean + random.randint(-5, 5)
+                             for _ in range(nb_antennas + 1)]
+                    result_file.write("10.0.0.{}\t10.0.0.{}\t{}\n".format(
+                        sender, receiver, ",".join(str(x) for x in rssis)))
+
+
+def timed(aggregator_class, run_root, node_ids, antenna_mask,
+          wireless_driver):
+    """
+    runs one aggregator, returns elapsed time and contents of RSSI.txt
+    """
+    beg = time.time()
+    aggregator_class(run_root, node_ids, antenna_mask, wireless_driver).run()
+    end = time.time()
+    return end - beg, (run_root / "RSSI.txt").read_bytes()
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-N", "--nodes", default=37, type=int,
+                        help="number of nodes")
+    parser.add_argument("-f", "--frames", default=500, type=int,
+                        help="number of frames for each link")
+    parser.add_argument("-a", "--antenna-mask", default=7, type=int,
+                        choices=[1, 3, 7])
+    parser.add_argument("-w", "--wifi-driver", default='ath9k',
+                        choices=['iwlwifi', 'ath9k'])
+    args = parser.parse_args()
+
+    node_ids = list(range(1, args.nodes + 1))
+    with TemporaryDirectory() as tmpdir:
+        run_root = Path(tmpdir)
+        print("generating {} frames in {} files"
+              .format(args.nodes * (args.nodes - 1) * args.frames,
+                      args.nodes))
+        make_results(run_root, node_ids, args.frames,
+                     args.antenna_mask, args.wifi_driver)
+        python_time, python_output = timed(
+            Aggregator, run_root, node_ids,
+            args.antenna_mask, args.wifi_driver)
+        numpy_time, numpy_output = timed(
+            ArrayAggregator, run_root, node_ids,
+            args.antenna_mask, args.wifi_driver)
+
+    print("Aggregator      : {:.3f}s".format(python_time))
+    print("ArrayAggregator : {:.3f}s (x{:.1f})"
+          .format(numpy_time, python_time / numpy_time))
+    identical = python_output == numpy_output
+    print("outputs are {}".format("identical" if identical else "DIFFERENT"))
+    return identical
+
+
+if __name__ == '__main__':
+    exit(0 if main() else 1)
@@ -0,0 +1,146 @@
+"""
+Keeping ssh connections open across the configs of a campaign
+
+A campaign calls one_run once per config; without a pool, each call
+creates its own gateway and node SshNode instances, and so pays for
+one handshake with the gateway, and one tunnelled handshake per node
+
+A ConnectionPool owns these SshNode instances for the whole campaign;
+before each config, co_prepare checks that the open connections still
+work, closes the broken ones, and (re)connects what is needed
+
+This relies on all configs running in the same event loop, which is
+the case as Scheduler.orchestrate uses asyncio.get_event_loop()
+"""
+
+import asyncio
+import time
+
+from apssh import SshNode
+from apssh import TimeColonFormatter
+
+# how often, in seconds, the lease needs be checked
+default_lease_period = 600
+
+
+class ConnectionPool:
+
+    """
+    the gateway and node SshNode instances for a whole campaign
+
+    Parameters:
+        gateway: the gateway hostname
+        slicename: the username on the gateway
+        verbose: passed to SshNode
+        lease_period: how often, in seconds, the lease needs be checked
+        timeout: how long, in seconds, a health check may take
+
+    counters holds
+    * connects: the number of handshakes done
+    * reconnects: how many of these were for a broken connection
+    * reused: the number of times an open connection was reused
+    * handshake_time: the total time spent in handshakes
+    * saved_time: an estimate of the time saved by reusing connections,
+      based on the last handshake time of each reused connection
+    """
+
+    def __init__(self, gateway, slicename, verbose=False,
+                 lease_period=default_lease_period, timeout=10):
+        self.verbose = verbose
+        self.lease_period = lease_period
+        self.timeout = timeout
+        self.gateway = SshNode(hostname=gateway, username=slicename,
+                               formatter=TimeColonFormatter(), verbose=verbose)
+        self.nodes = {}
+        # SshNode -> duration of its last handshake
+        self.handshakes = {}
+        self.last_lease_check = None
+        self.counters = dict(connects=0, reconnects=0, reused=0,
+                             handshake_time=0., saved_time=0.)
+
+    def node(self, node_id, hostname):
+        """
+        the SshNode for one node, created on first call
+        """
+        node_id = int(node_id)
+        if node_id not in self.nodes:
+            self.nodes[node_id] = SshNode(
+                gateway=self.gateway, hostname=hostname, username="root",
+                formatter=TimeColonFormatter(), verbose=self.verbose)
+        return self.nodes[node_id]
+
+    async def _healthy(self, proxy):
+        """
+        whether an open connection still answers
+        """
+        try:
+            await asyncio.wait_for(proxy.conn.run("true", check=True),
+                                   timeout=self.timeout)
+            return True
+        except Exception:                               # pylint: disable=w0703
+            await proxy.close()
+            return False
+
+    async def _connect(self, proxy):
+        """
+        makes sure proxy is connected, and keeps track of what it took
+        """
+        if proxy.is_connected():
+            if await self._healthy(proxy):
+                self.counters['reused'] += 1
+                self.counters['saved_time'] += self.handshakes.get(proxy, 0.)
+                return
+            self.counters['reconnects'] += 1
+        beg = time.time()
+        await proxy.connect_lazy()
+        self.handshakes[proxy] = time.time() - beg
+        self.counters['connects'] += 1
+        self.counters['handshake_time'] += self.handshakes[proxy]
+
+    async def co_prepare(self, node_ids):
+        """
+        checks and (re)connects the gateway, and then the nodes
+        in node_ids concurrently
+
+        a node that cannot be reached is left disconnected;
+        its jobs will then try and connect on their own, and fail
+        """
+        await self._connect(self.gateway)
+        proxies = [self.nodes[int(id)] for id in node_ids]
+        await asyncio.gather(*(self._connect(proxy) for proxy in proxies),
+                             return_exceptions=True)
+        return True
+
+    def lease_check_due(self):
+        """
+        whether the lease has not been checked in the last lease_period
+        """
+        return self.last_lease_check is None \
+            or time.time() - self.last_lease_check > self.lease_period
+
+    def lease_checked(self):
+        """
+        to be called once the lease has been successfully checked
+        """
+        self.last_lease_check = time.time()
+
+    async def co_close(self):
+        """
+        closes all connections, nodes first
+        """
+        await asyncio.gather(*(node.close() for node in self.nodes.values()))
+        await self.gateway.close()
+
+    def close(self):
+        """
+        synchroneous version of co_close
+        """
+        asyncio.get_event_loop().run_until_complete(self.co_close())
+
+    def summary(self):
+        """
+        a one-liner about the counters
+        """
+        return ("connections: {connects} handshakes ({reconnects} reconnects)"
+                " in {handshake_time:.1f}s, {reused} reused,"
+                " about {saved_time:.1f}s saved").format(**self.counters)
@@ -7,18 +7,28 @@ in this module instead
 
 The dasboard() function returns a widget suitable 
 as a second argument to interactive_output
+
+The live_dashboard() function is an alternative that does not rely on
+interactive_output, but updates a single plotly FigureWidget in place
 """
 
+import asyncio
 from collections import OrderedDict
+from pathlib import Path
 
 from ipywidgets import (interactive_output, fixed,
                         IntSlider, Dropdown, Layout, HBox, VBox, Text)
 from IPython.display import display
 
+import plotly.graph_objs as go
 
 # import a dictionary channel -> frequency
 from channels import channel_frequency, channel_options
 
+from rssi import read_rssi
+from r2labplotly import rssi_to_plotly3D
+from runstore import config_name
+
 
 def dashboard(datadir):
     """
@@ -68,3 +78,81 @@ def dashboard(datadir):
                 power=w_power, rate=w_rate, channel=w_channel,
                 antenna_mask=w_antenna_mask,
                 rssi_rank=w_rssi_rank)
+
+
+class LiveRadiomap:
+
+    """
+    a 2D radiomap that is created once, and then updated in place
+    when the dashboard widgets change
+
+    widget events are debounced: a render is scheduled *delay* seconds
+    after the last event, so a burst of slider moves results in a
+    single render, with the latest values; a render that has been
+    superseded by a newer event before it had a chance to run is dropped
+
+    counters keeps track of the number of events and actual renders
+    """
+
+    def __init__(self, widgets, delay=0.2):
+        self.widgets = widgets
+        self.delay = delay
+        self.generation = 0
+        self.pending = None
+        self.counters = dict(events=0, renders=0)
+        X, Y, Z, T = rssi_to_plotly3D({})
+        self.figure = go.FigureWidget(
+            data=[go.Heatmap(x=X[0], y=Y[:, 0], z=Z, text=T,
+                             zmin=-100, zmax=0, zauto=False)])
+        for widget in widgets.values():
+            widget.observe(self.schedule, 'value')
+
+    def schedule(self, *_):
+        """
+        widget callback - (re)starts the debounce timer
+        """
+        self.counters['events'] += 1
+        self.generation += 1
+        if self.pending is not None:
+            self.pending.cancel()
+        self.pending = asyncio.get_event_loop().call_later(
+            self.delay, self.render, self.generation)
+
+    def render(self, generation=None):
+        """
+        reads the current settings and updates the figure;
+        does nothing if another event has occurred since
+        generation was scheduled
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self.pending = None
+        self.counters['renders'] += 1
+        values = {name: widget.value for name, widget in self.widgets.items()}
+        config = (values['power'], values['rate'],
+                  values['antenna_mask'], values['channel'])
+        filename = str(Path(values['datadir']) / config_name(config)
+                       / "RSSI.txt")
+        # read_rssi is cached, so this does not hit the disk every time
+        rssi_dict = read_rssi(filename, values['sender'], values['rssi_rank'])
+        _, _, Z, T = rssi_to_plotly3D(rssi_dict)
+        title = "R2lab Radio-Map: Rx power (in dBm) when fit{:02d}"\
+                " is transmitting<br>from {}"\
+                .format(values['sender'], filename)
+        if not rssi_dict:
+            title += " (no data)"
+        with self.figure.batch_update():
+            self.figure.data[0].z = Z
+            self.figure.data[0].text = T
+            self.figure.layout.title = title
+
+
+def live_dashboard(datadir, delay=0.2):
+    """
+    displays the dashboard and a radiomap that gets updated in place
+    returns the LiveRadiomap instance
+    """
+    live = LiveRadiomap(dashboard(datadir), delay)
+    display(live.figure)
+    live.render()
+    return live
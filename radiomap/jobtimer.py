@@ -0,0 +1,209 @@
+"""
+Timing the jobs of a scheduler run
+
+A JobTimer wraps the co_run method of all the jobs in a scheduler, so
+as to record when each job actually starts - i.e. once it has its slot
+in the jobs window - and when it ends; from there it computes
+
+* the critical path: starting from the job that ends last, the chain
+  of jobs where each one is the requirement that ended last,
+  i.e. the one that was actually holding up the next one
+* a summary per phase, where jobs are grouped into phases after
+  their label
+* a trace in the Chrome trace format, that can be loaded in
+  chrome://tracing or https://ui.perfetto.dev as a Gantt chart
+
+Example:
+    timer = JobTimer(scheduler, phases=[("pings", "ping "), ...])
+    ok = scheduler.orchestrate()
+    print(timer.report())
+    timer.save("timing.json")
+
+The JobTimer must be created once all jobs are in the scheduler
+"""
+
+import json
+import re
+import time
+from pathlib import Path
+
+# the default name for the saved trace, in the run directory
+timing_name = "timing.json"
+
+
+def label_of(job):
+    """
+    the label of a job, or its text_label, or its class name
+    """
+    return job.label or job.text_label() or type(job).__name__
+
+
+class JobTimer:
+
+    """
+    records the start and end times of the jobs in scheduler
+
+    Parameters:
+        scheduler: the scheduler, with all its jobs already added
+        phases: a list of (phase, pattern) tuples; a job belongs to
+          the first phase whose pattern matches the start of its label;
+          other jobs belong to a phase named after the first word
+          of their label
+    """
+
+    def __init__(self, scheduler, phases=None):
+        self.phases = [(phase, re.compile(pattern))
+                       for phase, pattern in (phases or [])]
+        # job -> dict(start, end, outcome)
+        self.times = {}
+        for job in scheduler.jobs:
+            self.instrument(job)
+
+    def instrument(self, job):
+        """
+        replaces the job's co_run with a timed version
+        """
+        co_run = job.co_run
+
+        async def timed_co_run():
+            times = self.times[job] = dict(start=time.time(), end=None,
+                                           outcome='running')
+            try:
+                result = await co_run()
+                times['outcome'] = 'ok'
+                return result
+            except BaseException:
+                times['outcome'] = 'failed'
+                raise
+            finally:
+                times['end'] = time.time()
+        job.co_run = timed_co_run
+
+    def phase_of(self, job):
+        label = label_of(job)
+        for phase, pattern in self.phases:
+            if pattern.match(label):
+                return phase
+        return label.split()[0] if label.split() else label
+
+    def origin(self):
+        """
+        the time at which the first job started
+        """
+        return min(times['start'] for times in self.times.values())
+
+    def total(self):
+        """
+        the elapsed time between the first start and the last end
+        """
+        if not self.times:
+            return 0.
+        return max(times['end'] for times in self.times.values()) \
+            - self.origin()
+
+    def critical_path(self):
+        """
+        Returns:
+            the list of jobs on the critical path, in chronological order
+        """
+        if not self.times:
+            return []
+        job = max(self.times, key=lambda job: self.times[job]['end'])
+        path = [job]
+        while True:
+            required = [req for req in job.required if req in self.times]
+            if not required:
+                break
+            job = max(required, key=lambda req: self.times[req]['end'])
+            path.append(job)
+        return path[::-1]
+
+    def summary(self):
+        """
+        Returns:
+            a list of dicts, one per phase in chronological order, with
+            phase, jobs (how many), first (start, relative to origin),
+            wall (from first start to last end), busy (the sum of the
+            job durations) and critical (the time spent in that
+            phase on the critical path); plus a last entry
+            for the idle time on the critical path, i.e. the time
+            between the end of a job and the start of the next one
+        """
+        if not self.times:
+            return []
+        origin = self.origin()
+        phases = {}
+        for job, times in self.times.items():
+            phase = phases.setdefault(self.phase_of(job), dict(
+                phase=self.phase_of(job), jobs=0, first=times['start'],
+                last=times['end'], busy=0., critical=0.))
+            phase['jobs'] += 1
+            phase['first'] = min(phase['first'], times['start'])
+            phase['last'] = max(phase['last'], times['end'])
+            phase['busy'] += times['end'] - times['start']
+        on_path = 0.
+        for job in self.critical_path():
+            times = self.times[job]
+            phases[self.phase_of(job)]['critical'] += \
+                times['end'] - times['start']
+            on_path += times['end'] - times['start']
+        result = []
+        for phase in sorted(phases.values(), key=lambda p: p['first']):
+            phase['wall'] = phase.pop('last') - phase['first']
+            phase['first'] -= origin
+            result.append(phase)
+        result.append(dict(phase='(idle)', jobs=0, first=0., wall=0.,
+                           busy=0., critical=self.total() - on_path))
+        return result
+
+    def report(self):
+        """
+        the per-phase summary, as a printable table
+        """
+        lines = ["{:<16} {:>5} {:>9} {:>9} {:>9} {:>9}".format(
+            "phase", "jobs", "start", "wall", "busy", "critical")]
+        for phase in self.summary():
+            lines.append(
+                "{phase:<16} {jobs:>5} {first:>9.1f} {wall:>9.1f}"
+                " {busy:>9.1f} {critical:>9.1f}".format(**phase))
+        lines.append("{:<16} {:>5} {:>9} {:>9.1f}".format(
+            "total", len(self.times), "", self.total()))
+        return "\n".join(lines)
+
+    def trace(self):
+        """
+        the run in the Chrome trace format; jobs are spread over lanes
+        so that jobs in one lane do not overlap, and the summary
+        is stored in otherData
+        """
+        if not self.times:
+            return dict(traceEvents=[], otherData=dict(phases=[]))
+        origin = self.origin()
+        critical = set(self.critical_path())
+        lanes = []
+        events = []
+        for job in sorted(self.times, key=lambda job: self.times[job]['start']):
+            times = self.times[job]
+            for lane, busy_until in enumerate(lanes):
+                if busy_until <= times['start']:
+                    break
+            else:
+                lane = len(lanes)
+                lanes.append(None)
+            lanes[lane] = times['end']
+            events.append(dict(
+                name=label_of(job), cat=self.phase_of(job), ph='X', pid=1,
+                tid=lane, ts=round((times['start'] - origin) * 1e6),
+                dur=round((times['end'] - times['start']) * 1e6),
+                args=dict(outcome=times['outcome'],
+                          critical=job in critical)))
+        return dict(traceEvents=events, displayTimeUnit='ms',
+                    otherData=dict(origin=origin, total=self.total(),
+                                   phases=self.summary()))
+
+    def save(self, filename):
+        """
+        writes the trace in filename
+        """
+        with Path(filename).open('w') as trace_file:
+            json.dump(self.trace(), trace_file)
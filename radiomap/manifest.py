@@ -0,0 +1,193 @@
+"""
+Keeping track of what a campaign has achieved so far
+
+A manifest.json file in the run directory has one entry per config,
+named after naming_scheme, with
+* config: the (tx_power, phy_rate, antenna_mask, channel) settings
+* status: running, ok or failed
+* started, ended and duration, in seconds since epoch / seconds
+* node_ids: the nodes involved
+* acquired: whether the pings were complete, i.e. whether at least
+  one node has had its results pulled
+* files: a dictionary filename -> sha256 for the files pulled from
+  each node, and for RSSI.txt and friends once aggregated
+
+plus, at the top level, last: the name of the last config started,
+which is the only one whose pcap files may still be on the nodes
+
+This is what all_runs relies on in resume mode
+"""
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+from runstore import config_name
+
+manifest_name = "manifest.json"
+
+MANIFEST_VERSION = 1
+
+# the files produced by aggregation, when present
+aggregated_names = ("RSSI.txt", "RSSI-stats.txt", "RSSI-samples.npz")
+
+
+def checksum(path):
+    """
+    the sha256 of a file, as a hex string
+    """
+    sha = hashlib.sha256()
+    with Path(path).open('rb') as in_file:
+        for chunk in iter(lambda: in_file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def node_names(node_id):
+    """
+    the files pulled from one node, that end up in the config directory
+    """
+    return ["fit{}.pcap".format(node_id), "fit{}.rssi.gz".format(node_id),
+            "result-{}.txt".format(node_id)]
+
+
+class Manifest:
+
+    """
+    the contents of <run_name>/manifest.json
+
+    all methods that change the manifest also save it; they can be
+    called from several threads
+    """
+
+    def __init__(self, run_name):
+        self.filename = Path(run_name) / manifest_name
+        self.lock = threading.Lock()
+        if self.filename.exists():
+            with self.filename.open() as manifest_file:
+                self.contents = json.load(manifest_file)
+            if self.contents['version'] != MANIFEST_VERSION:
+                raise ValueError("{}: unsupported version {}"
+                                 .format(self.filename,
+                                         self.contents['version']))
+        else:
+            self.contents = dict(version=MANIFEST_VERSION, last=None,
+                                 configs={})
+
+    def save(self):
+        """
+        (over)writes manifest.json; a temporary file is renamed
+        so that an interrupted campaign never leaves a broken manifest
+        """
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.filename.with_suffix(".tmp")
+        with temporary.open('w') as manifest_file:
+            json.dump(self.contents, manifest_file, indent=1, sort_keys=True)
+        temporary.replace(self.filename)
+
+    def entry(self, config):
+        """
+        the entry for a (tx_power, phy_rate, antenna_mask, channel) config,
+        or None
+        """
+        return self.contents['configs'].get(config_name(config))
+
+    def start(self, config, node_ids):
+        """
+        records that config is about to be acquired from scratch
+        """
+        with self.lock:
+            name = config_name(config)
+            self.contents['configs'][name] = dict(
+                config=list(config), status='running', started=time.time(),
+                ended=None, duration=None,
+                node_ids=[int(id) for id in node_ids],
+                acquired=False, files={})
+            self.contents['last'] = name
+            self.save()
+
+    def record_node(self, config, run_root, node_id):
+        """
+        records the checksums of the files pulled from one node
+        """
+        files = {name: checksum(Path(run_root) / name)
+                 for name in node_names(node_id)
+                 if (Path(run_root) / name).exists()}
+        with self.lock:
+            entry = self.entry(config)
+            entry['acquired'] = True
+            entry['files'].update(files)
+            self.save()
+
+    def finish(self, config, ok, run_root):
+        """
+        records the outcome, and the checksums of RSSI.txt and friends
+        """
+        files = {name: checksum(Path(run_root) / name)
+                 for name in aggregated_names
+                 if ok and (Path(run_root) / name).exists()}
+        with self.lock:
+            entry = self.entry(config)
+            entry['status'] = 'ok' if ok else 'failed'
+            entry['ended'] = time.time()
+            entry['duration'] = entry['ended'] - entry['started']
+            entry['files'].update(files)
+            self.save()
+
+    def valid(self, config, run_root, name):
+        """
+        whether a file is recorded, present, and has not changed
+        """
+        entry = self.entry(config)
+        if entry is None or name not in entry['files']:
+            return False
+        path = Path(run_root) / name
+        return path.exists() and checksum(path) == entry['files'][name]
+
+    def is_complete(self, config, run_root):
+        """
+        whether config went fine, and all its recorded files - the ones
+        pulled from the nodes, RSSI.txt and friends - are still valid
+        """
+        entry = self.entry(config)
+        return entry is not None and entry['status'] == 'ok' \
+            and "RSSI.txt" in entry['files'] \
+            and all(self.valid(config, run_root, name)
+                    for name in entry['files'])
+
+    def missing_nodes(self, config, run_root):
+        """
+        the nodes whose result-<N>.txt is missing or corrupt,
+        or whose pcap file was recorded but is missing or corrupt
+        """
+        entry = self.entry(config)
+        if entry is None:
+            return None
+        return [
+            node_id for node_id in entry['node_ids']
+            if not self.valid(config, run_root,
+                              "result-{}.txt".format(node_id))
+            or ("fit{}.pcap".format(node_id) in entry['files']
+                and not self.valid(config, run_root,
+                                   "fit{}.pcap".format(node_id)))
+        ]
+
+    def last_config(self):
+        """
+        the last config started, as a tuple, or None
+        """
+        last = self.contents['last']
+        if last is None:
+            return None
+        return tuple(self.contents['configs'][last]['config'])
+
+    def can_repull(self, config):
+        """
+        whether the nodes may still have the pcap files for config,
+        i.e. if its pings were complete and no other config started since
+        """
+        entry = self.entry(config)
+        return entry is not None and entry['acquired'] \
+            and self.contents['last'] == config_name(config)
@@ -27,6 +27,8 @@ function init-ad-hoc-network (){
     phyrate=$1; shift
     antmask=$1; shift
     txpower=$1; shift
+    # optional: set to no-tshark when pcap files are processed locally
+    tshark=${1:-tshark}
 
     # load the r2lab utilities - code can be found here:
     # https://github.com/parmentelat/r2lab/blob/master/infra/user-env/nodes.sh
@@ -38,9 +40,11 @@ function init-ad-hoc-network (){
     # make sure to use the latest code on the node
     git-pull-r2lab
 
-    # install tshark on the node for the post-processing step
-    echo  "Installing tshark"
-    apt-get install -y tshark
+    if [ "$tshark" != "no-tshark" ]; then
+        # install tshark on the node for the post-processing step
+        echo  "Installing tshark"
+        apt-get install -y tshark
+    fi
     
 #    turn-off-wireless
 
@@ -123,6 +127,83 @@ function init-ad-hoc-network (){
     
 }
 
+# a lightweight version of init-ad-hoc-network, for when the node
+# already is in the ad-hoc network with another config
+# same first 6 arguments as init-ad-hoc-network, with the new values,
+# then the names of the settings that have changed, among
+# freq phyrate antmask txpower
+function reconfigure-ad-hoc-network (){
+    driver=$1; shift
+    netname=$1; shift
+    freq=$1;   shift
+    phyrate=$1; shift
+    antmask=$1; shift
+    txpower=$1; shift
+    changes="$@"
+
+    source /root/r2lab/infra/user-env/nodes.sh
+
+    ifname=$(wait-for-interface-on-driver $driver)
+    phyname=`iw $ifname info|grep wiphy |awk '{print "phy"$2}'`
+    moniname="moni-$driver"
+
+    # changing the antennas or the frequency means leaving the cell
+    rejoin=""
+    for change in $changes; do
+	case $change in
+	    freq|antmask) rejoin=true ;;
+	esac
+    done
+
+    if [ -n "$rejoin" ]; then
+	echo "Leaving $netname on $ifname"
+	ip link set $moniname down 2>/dev/null
+	iw dev $ifname ibss leave 2>/dev/null
+	ip link set $ifname down
+	if test ${ifname} == "atheros" && [[ " $changes " == *" antmask "* ]]; then
+	    echo "Configuring $phyname with antenna mask $antmask"
+	    iw phy $phyname set antenna $antmask
+	fi
+	ip link set $ifname up
+	# like in init-ad-hoc-network, nodes must not all join at the same time,
+	# or they may create different cells; [0-20s] is enough for a rejoin
+	TSLEEP=`echo "scale=2;$RANDOM/1638.35" |bc`
+	echo "Now sleep for $TSLEEP seconds"
+	sleep $TSLEEP
+	echo "Joining $netname with ibss mode on frequency $freq MHz"
+	iw dev $ifname ibss join $netname $freq
+	sleep 2
+	ip link set $moniname up
+	# tx power and bitrates do not survive a new join
+	changes="$changes txpower phyrate"
+    fi
+
+    if [[ " $changes " == *" txpower "* ]]; then
+	echo "Setting the transmission power to $txpower"
+	iw dev $ifname set txpower fixed $txpower
+	echo "Checking Tx Power value"
+	iwconfig $ifname | grep dBm
+    fi
+    if [[ " $changes " == *" phyrate "* ]]; then
+	if test $freq -le 3000
+	  then
+	    echo "Configuring bitrates to legacy-2.4 $phyrate Mbps"
+	    iw dev $ifname set bitrates legacy-2.4 $phyrate
+	  else
+	    echo "Configuring bitrates to legacy-5 $phyrate Mbps"
+	    iw dev $ifname set bitrates legacy-5 $phyrate
+	fi
+    fi
+
+    if [ -n "$rejoin" ]; then
+	echo "Waiting 10 seconds to allow cells association"
+	sleep 10
+    fi
+
+    echo "Final configuration:"
+    iwconfig $ifname
+}
+
 function my-ping (){
     dest=$1; shift
     ptimeout=$1; shift
@@ -137,6 +218,30 @@ function my-ping (){
     return 0
 }
 
+# same as my-ping, but towards several destinations in turn
+# the output for each destination is stored in PING-<src>-<dest>
+# just like with individual my-ping calls, and all these files
+# are gathered in a single tar file so they can be pulled at once
+function my-ping-all (){
+    src=$1; shift
+    tarname=$1; shift
+    ptimeout=$1; shift
+    pint=$1; shift
+    psize=$1; shift
+    pnumber=$1; shift
+    # the remaining arguments are the destination node numbers
+
+    files=""
+    for dest in "$@"; do
+	output=$(printf "PING-%02d-%02d" $src $dest)
+	echo "$src '->' $dest"
+	my-ping 10.0.0.$dest $ptimeout $pint $psize $pnumber > $output
+	files="$files $output"
+    done
+    tar -cf $tarname $files
+    return 0
+}
+
 
 function process-pcap (){
     node=$1; shift
@@ -0,0 +1,140 @@
+"""
+Grouping the pairs of nodes to ping into rounds of pairs that can
+safely run at the same time
+
+Two pairs conflict if they share a node, or if a node of one pair is
+a neighbour of a node of the other pair - either adjacent or diagonal
+on the r2labmap layout, or, when a previous measurement is available,
+among the loudest links of that measurement
+
+The rounds are the colors of a DSatur coloring of the conflict graph;
+all pairs in one round can run concurrently, and rounds run one
+after the other; on the whole testbed, this means 158 rounds for the
+666 pairs, i.e. about 4 pairs at a time, and with any of the
+datasample references - whatever the antenna mask - between 177
+and 206 rounds
+"""
+
+import numpy as np
+
+from rssi import cached_rssi_matrix
+from pathloss import distances
+from processmap import Aggregator
+
+# in meters, see pathloss.SPACING; nodes that are at most that far
+# apart do interfere, so by default adjacent and diagonal nodes
+default_min_distance = 1.5
+# the fraction of the links in a reference that are deemed loud
+# enough to interfere; rssi_rank 0 combines all antennas, so its
+# level depends on the antenna mask, hence a fraction rather
+# than a fixed threshold in dBm
+default_loud_fraction = 0.1
+
+
+def loud_threshold(matrix, loud_fraction=default_loud_fraction):
+    """
+    the rssi above which a link is among the loud_fraction loudest
+    ones in matrix, a [sender, receiver, column] array as returned
+    by rssi.cached_rssi_matrix; only column 0 is considered, and
+    links that received nothing are ignored
+    """
+    values = matrix[:, :, 0][~np.eye(len(matrix), dtype=bool)]
+    values = values[values > Aggregator.RSSI_MIN]
+    if not len(values):
+        return np.inf
+    return np.percentile(values, 100 * (1 - loud_fraction))
+
+
+def interference_matrix(node_ids, min_distance=default_min_distance,
+                        max_rssi=None, reference=None,
+                        loud_fraction=default_loud_fraction):
+    """
+    a boolean (nodes x nodes) matrix that is True when 2 nodes
+    must not be involved in concurrent pings; always True on the diagonal
+
+    Parameters:
+        reference: an optional RSSI.txt file from a previous run,
+          with rssi_rank 0 used as the measured link strength
+        max_rssi: in dBm, links in reference louder than this do
+          interfere; defaults to loud_threshold(reference, loud_fraction)
+    """
+    node_ids = [int(id) for id in node_ids]
+    interfere = distances(node_ids) <= min_distance
+    if reference is not None:
+        ids, ranks, matrix = cached_rssi_matrix(reference)
+        if max_rssi is None:
+            max_rssi = loud_threshold(matrix, loud_fraction)
+        known = [node_id for node_id in node_ids if node_id in ranks]
+        mine = [node_ids.index(node_id) for node_id in known]
+        theirs = [ranks[node_id] for node_id in known]
+        with np.errstate(invalid='ignore'):
+            loud = matrix[np.ix_(theirs, theirs)][:, :, 0] > max_rssi
+        # links are not quite symmetric
+        interfere[np.ix_(mine, mine)] |= loud | loud.T
+    np.fill_diagonal(interfere, True)
+    return interfere
+
+
+def conflict_graph(pairs, interfere):
+    """
+    Parameters:
+        pairs: a (P, 2) array of ranks in the interference matrix
+
+    Returns:
+        a boolean (P x P) adjacency matrix
+    """
+    a, b = pairs[:, 0], pairs[:, 1]
+    conflicts = interfere[np.ix_(a, a)] | interfere[np.ix_(a, b)] \
+        | interfere[np.ix_(b, a)] | interfere[np.ix_(b, b)]
+    np.fill_diagonal(conflicts, False)
+    return conflicts
+
+
+def dsatur_coloring(conflicts):
+    """
+    colors the nodes of a graph with the DSatur heuristic: the next
+    node is the one whose neighbours already use the most distinct
+    colors - ties broken by degree - and it gets the smallest color
+    not used by its neighbours
+
+    Returns:
+        an array of colors, starting at 0
+    """
+    size = len(conflicts)
+    colors = np.full(size, -1)
+    degrees = conflicts.sum(axis=1)
+    # [vertex, color] is True if a neighbour of vertex has that color
+    neighbour_colors = np.zeros((size, size + 1), dtype=bool)
+    for _ in range(size):
+        saturation = neighbour_colors.sum(axis=1)
+        priority = np.where(colors < 0, saturation * (size + 1) + degrees, -1)
+        vertex = np.argmax(priority)
+        color = np.argmin(neighbour_colors[vertex])
+        colors[vertex] = color
+        neighbour_colors[conflicts[vertex], color] = True
+    return colors
+
+
+def ping_rounds(node_ids, **kwds):
+    """
+    groups all pairs (i, j) with i < j into rounds
+
+    Parameters:
+        node_ids: the nodes involved
+        kwds: passed to interference_matrix
+
+    Returns:
+        a list of rounds, each being a list of (i, j) node ids
+    """
+    node_ids = sorted(int(id) for id in node_ids)
+    pairs = np.array([(a, b) for a in range(len(node_ids))
+                      for b in range(a + 1, len(node_ids))],
+                     dtype=int).reshape(-1, 2)
+    if not len(pairs):
+        return []
+    colors = dsatur_coloring(
+        conflict_graph(pairs, interference_matrix(node_ids, **kwds)))
+    return [
+        [(node_ids[a], node_ids[b]) for a, b in pairs[colors == color]]
+        for color in range(colors.max() + 1)
+    ]
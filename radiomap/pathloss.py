@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+Fitting a log-distance path-loss model on all links of a run
+
+For each config, the received power on link (sender, receiver) is modeled as
+
+    rssi = intercept - 10 * exponent * log10(distance) + shadowing
+
+where distance is computed from the node positions in r2labmap, and
+shadowing is a gaussian with standard deviation sigma
+
+All configs of a run are fitted at once: the links of each config are
+stacked in a (configs x links) array, and the least-squares solution
+of this 2-parameter regression is computed in closed form from
+the masked sums, so there is no python loop over configs
+"""
+
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+import pandas as pd
+
+import r2labmap
+from processmap import Aggregator
+from runstore import open_store, config_axes
+
+# distance between 2 adjacent nodes, in meters
+SPACING = 1.0
+
+result_columns = ['exponent', 'intercept', 'sigma', 'links']
+
+
+def distances(node_ids, spacing=SPACING):
+    """
+    a (nodes x nodes) array of distances in meters
+    """
+    node_to_position, _, _ = r2labmap.maps(lambda x: x, lambda y: y)
+    positions = np.array([node_to_position[node_id] for node_id in node_ids],
+                         dtype=float)
+    return spacing * np.linalg.norm(
+        positions[:, np.newaxis, :] - positions[np.newaxis, :, :], axis=2)
+
+
+def fit(values, distance):
+    """
+    fits the model on stacked configs
+
+    Parameters:
+        values: an array of shape (configs, links) of received powers,
+          with NaN where a link must be ignored
+        distance: an array of shape (links,), all > 0
+
+    Returns:
+        a tuple of arrays of shape (configs,):
+        exponent, intercept, sigma, and the number of links used;
+        configs with less than 3 links come out as NaN
+    """
+    x = np.broadcast_to(-10 * np.log10(distance), values.shape)
+    known = ~np.isnan(values)
+    y = np.where(known, values, 0)
+    x = np.where(known, x, 0)
+    n = known.sum(axis=1)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        exponent = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - exponent * sx) / n
+        residuals = np.where(known, y - intercept[:, np.newaxis]
+                             - exponent[:, np.newaxis] * x, 0)
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / (n - 2))
+    too_few = n < 3
+    for array in (exponent, intercept, sigma):
+        array[too_few] = np.nan
+    return exponent, intercept, sigma, n
+
+
+def fit_run(run_name, rssi_rank=0, spacing=SPACING):
+    """
+    fits the model for every config of run_name
+
+    self links, and links that received nothing - that show up
+    as RSSI_MIN in RSSI.txt - are ignored
+
+    Returns:
+        a DataFrame indexed by (tx_power, phy_rate, antenna_mask, channel)
+        with columns exponent, intercept (in dBm at 1m), sigma (in dB)
+        and links (the number of links used)
+    """
+    store = open_store(run_name)
+    node_ids = store.node_ids
+    nb_nodes = len(node_ids)
+    configs = store.configs()
+    if not configs or rssi_rank >= store.data.shape[-1]:
+        return pd.DataFrame(
+            columns=result_columns,
+            index=pd.MultiIndex.from_tuples([], names=config_axes))
+    # (configs, sender, receiver)
+    values = np.stack([store.matrix(*config)[:, :, rssi_rank]
+                       for config in configs]).astype(float)
+    values[values <= Aggregator.RSSI_MIN] = np.nan
+    off_diagonal = ~np.eye(nb_nodes, dtype=bool)
+    exponent, intercept, sigma, n = fit(
+        values[:, off_diagonal], distances(node_ids, spacing)[off_diagonal])
+    return pd.DataFrame(
+        dict(exponent=exponent, intercept=intercept, sigma=sigma, links=n),
+        columns=result_columns,
+        index=pd.MultiIndex.from_tuples(configs, names=config_axes),
+    ).sort_index()
+
+
+def main():
+    """
+    prints the fitted model for each config of one or several runs
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-r", "--rssi-rank", default=0, type=int,
+                        help="which rssi value to use")
+    parser.add_argument("-s", "--spacing", default=SPACING, type=float,
+                        help="distance between adjacent nodes in meters")
+    parser.add_argument("run_names", nargs='+')
+    args = parser.parse_args()
+
+    for run_name in args.run_names:
+        print("==================== {}".format(run_name))
+        print(fit_run(run_name, args.rssi_rank, args.spacing)
+              .to_string(float_format="{:.2f}".format))
+    return True
+
+
+if __name__ == '__main__':
+    exit(0 if main() else 1)
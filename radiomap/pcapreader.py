@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+"""
+A pure python replacement for the tshark-based process-pcap step
+
+Walks the pcap files captured with tcpdump on the moni-* interfaces
+(radiotap link type), and extracts for each ICMP frame
+the source and destination IP addresses, as well as the dBm antenna
+signal fields; this is what tshark does with
+
+    tshark -2 -r fitN.pcap -R "ip.dst==10.0.0.N && icmp" -Tfields
+           -e ip.src -e ip.dst -e radiotap.dbm_antsignal
+
+so that the pulled fitN.pcap files can be processed locally,
+with no need for tshark on the nodes
+
+This module can also run on the nodes themselves (it only needs
+the standard library) to reduce a capture into a compact stream
+of fixed-width records, see encode_pcap; the result is much
+smaller than the pcap file, and is decoded locally with decode_records
+"""
+
+import gzip
+import mmap
+import struct
+from array import array
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# pcap magic numbers, microsecond and nanosecond flavours
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+# as in tcpdump -y ieee802_11_radio
+LINKTYPE_RADIOTAP = 127
+
+# radiotap fields in the default namespace: bit -> (alignment, size)
+# see http://www.radiotap.org/fields/defined
+radiotap_fields = {
+    0: (8, 8),          # TSFT
+    1: (1, 1),          # Flags
+    2: (1, 1),          # Rate
+    3: (2, 4),          # Channel
+    4: (1, 2),          # FHSS
+    5: (1, 1),          # dBm antenna signal
+    6: (1, 1),          # dBm antenna noise
+    7: (2, 2),          # Lock quality
+    8: (2, 2),          # TX attenuation
+    9: (2, 2),          # dB TX attenuation
+    10: (1, 1),         # dBm TX power
+    11: (1, 1),         # Antenna
+    12: (1, 1),         # dB antenna signal
+    13: (1, 1),         # dB antenna noise
+    14: (2, 2),         # RX flags
+    15: (2, 2),         # TX flags
+    16: (1, 1),         # RTS retries
+    17: (1, 1),         # data retries
+    18: (4, 8),         # XChannel
+    19: (1, 3),         # MCS
+    20: (4, 8),         # A-MPDU status
+    21: (2, 12),        # VHT
+    22: (8, 12),        # timestamp
+    23: (2, 12),        # HE
+    24: (2, 12),        # HE-MU
+    25: (2, 6),         # HE-MU-other-user
+    26: (1, 1),         # 0-length-PSDU
+    27: (2, 4),         # L-SIG
+}
+RADIOTAP_DBM_ANTSIGNAL = 5
+RADIOTAP_FLAGS = 1
+# in the Flags field
+FLAGS_DATAPAD = 0x20
+# in the present words
+PRESENT_RADIOTAP_NS = 1 << 29
+PRESENT_VENDOR_NS = 1 << 30
+PRESENT_EXT = 1 << 31
+
+# compact records: timestamp, src, dst, number of dbm values, dbm values
+COMPACT_MAGIC = b'RSSI\x01'
+COMPACT_SIGNALS = 4
+compact_record = struct.Struct('<d4s4sB{}b'.format(COMPACT_SIGNALS))
+# enough for radiotap with several antennas, 802.11, LLC, IP and ICMP
+# headers; used as tcpdump's snaplen
+capture_snaplen = 192
+
+# LLC/SNAP header for IPv4
+LLC_SNAP_IPV4 = b'\xaa\xaa\x03\x00\x00\x00\x08\x00'
+IPPROTO_ICMP = 1
+
+
+def ip_address(packed):
+    """
+    dotted notation for a 4-bytes address
+    """
+    return "{}.{}.{}.{}".format(*packed)
+
+
+def radiotap_signals(buffer, start):
+    """
+    walks the radiotap header that starts at *start* in buffer
+
+    Returns:
+        a tuple (length, flags, dbms) with the header total length,
+        the Flags field (0 if absent) and a list of all the
+        dBm antenna signal values, in the order where they show up
+    """
+    _, _, length = struct.unpack_from('<BBH', buffer, start)
+    # collect present words
+    words = []
+    offset = start + 4
+    while True:
+        word, = struct.unpack_from('<I', buffer, offset)
+        words.append(word)
+        offset += 4
+        if not word & PRESENT_EXT:
+            break
+    # alignments are relative to the beginning of the header
+    position = offset - start
+    flags, dbms = 0, []
+    namespace, base = 'radiotap', 0
+    for word in words:
+        if namespace == 'radiotap':
+            for bit in range(29):
+                if not word & (1 << bit):
+                    continue
+                field = base + bit
+                if field not in radiotap_fields:
+                    # cannot go any further without knowing this size
+                    return length, flags, dbms
+                align, size = radiotap_fields[field]
+                position = (position + align - 1) & ~(align - 1)
+                if position + size > length:
+                    return length, flags, dbms
+                if field == RADIOTAP_DBM_ANTSIGNAL:
+                    dbms.append(struct.unpack_from(
+                        '<b', buffer, start + position)[0])
+                elif field == RADIOTAP_FLAGS:
+                    flags = buffer[start + position]
+                position += size
+        elif namespace == 'vendor-start':
+            # OUI (3 bytes), sub-namespace (1 byte), skip length (2 bytes)
+            position = (position + 1) & ~1
+            skip_length, = struct.unpack_from(
+                '<H', buffer, start + position + 4)
+            position += 6 + skip_length
+            namespace = 'vendor'
+        # figure out what the next word is about
+        if word & PRESENT_RADIOTAP_NS:
+            namespace, base = 'radiotap', 0
+        elif word & PRESENT_VENDOR_NS:
+            namespace, base = 'vendor-start', 0
+        else:
+            base += 32
+    return length, flags, dbms
+
+
+def ieee80211_payload(buffer, start, end, datapad):
+    """
+    locates the payload of a 802.11 data frame
+
+    Returns:
+        the offset of the LLC header, or None if this is not
+        an unprotected data frame with a payload
+    """
+    if end - start < 24:
+        return None
+    fc0, fc1 = buffer[start], buffer[start + 1]
+    frame_type, subtype = (fc0 >> 2) & 0x3, fc0 >> 4
+    # data frames only, and not null-function ones
+    if frame_type != 2 or subtype & 0x4:
+        return None
+    # protected frames cannot be decoded
+    if fc1 & 0x40:
+        return None
+    header_length = 24
+    # both ToDS and FromDS: a 4th address
+    if fc1 & 0x3 == 0x3:
+        header_length += 6
+    # QoS data
+    if subtype & 0x8:
+        header_length += 2
+        # HT control
+        if fc1 & 0x80:
+            header_length += 4
+    if datapad:
+        header_length = (header_length + 3) & ~3
+    return start + header_length
+
+
+def pcap_records(pcap_name, dst=None):
+    """
+    a generator on the ICMP frames present in a radiotap pcap file
+
+    Parameters:
+        pcap_name: the pcap filename
+        dst: if not None, only frames whose IP destination
+             matches this dotted address are considered
+
+    Yields:
+        tuples (src, dst, dbms) where src and dst are IP addresses
+        in dotted notation, and dbms a tuple of the dBm antenna signal
+        values, as reported by tshark in radiotap.dbm_antsignal
+    """
+    for src, frame_dst, dbms, _ in pcap_frames(pcap_name, dst):
+        yield src, frame_dst, dbms
+
+
+def pcap_frames(pcap_name, dst=None):
+    """
+    same as pcap_records, but yields 4-tuples (src, dst, dbms, timestamp)
+    with the capture timestamp in seconds since the epoch
+    """
+    with open(pcap_name, 'rb') as pcap_file:
+        # an empty capture cannot be mapped
+        if not Path(pcap_name).stat().st_size:
+            return
+        with mmap.mmap(pcap_file.fileno(), 0,
+                       access=mmap.ACCESS_READ) as buffer:
+            yield from _walk_pcap(buffer, dst)
+
+
+def _walk_pcap(buffer, dst):
+    """
+    the actual loop on records, once the file is mapped in memory
+    """
+    magic, = struct.unpack_from('<I', buffer, 0)
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        endian = '<'
+    else:
+        endian = '>'
+        magic, = struct.unpack_from('>I', buffer, 0)
+        if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            raise ValueError("not a pcap file")
+    resolution = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+    linktype, = struct.unpack_from(endian + 'I', buffer, 20)
+    if linktype & 0xffff != LINKTYPE_RADIOTAP:
+        raise ValueError("unexpected link type {}".format(linktype))
+    record_header = struct.Struct(endian + 'IIII')
+    offset, size = 24, len(buffer)
+    while offset + record_header.size <= size:
+        seconds, fraction, captured, _ = \
+            record_header.unpack_from(buffer, offset)
+        start = offset + record_header.size
+        end = min(start + captured, size)
+        offset = start + captured
+        if end - start < 8:
+            continue
+        length, flags, dbms = radiotap_signals(buffer, start)
+        llc = ieee80211_payload(buffer, start + length, end,
+                                flags & FLAGS_DATAPAD)
+        if llc is None or llc + len(LLC_SNAP_IPV4) + 20 > end:
+            continue
+        if buffer[llc:llc + len(LLC_SNAP_IPV4)] != LLC_SNAP_IPV4:
+            continue
+        ip = llc + len(LLC_SNAP_IPV4)
+        if buffer[ip] >> 4 != 4 or buffer[ip + 9] != IPPROTO_ICMP:
+            continue
+        frame_dst = ip_address(buffer[ip + 16:ip + 20])
+        if dst is not None and frame_dst != dst:
+            continue
+        yield (ip_address(buffer[ip + 12:ip + 16]), frame_dst,
+               tuple(dbms), seconds + fraction * resolution)
+
+
+def encode_pcap(pcap_name, encoded_name, dst=None):
+    """
+    reduces a pcap file into a gzipped stream of compact_record's,
+    one per frame that pcap_frames would yield
+
+    Returns:
+        the number of frames retained
+    """
+    frames = 0
+    with gzip.open(str(encoded_name), 'wb') as encoded:
+        encoded.write(COMPACT_MAGIC)
+        for src, frame_dst, dbms, timestamp in pcap_frames(pcap_name, dst):
+            dbms = dbms[:COMPACT_SIGNALS]
+            padded = dbms + (0,) * (COMPACT_SIGNALS - len(dbms))
+            encoded.write(compact_record.pack(
+                timestamp, bytes(int(x) for x in src.split('.')),
+                bytes(int(x) for x in frame_dst.split('.')),
+                len(dbms), *padded))
+            frames += 1
+    return frames
+
+
+def decode_records(encoded_name):
+    """
+    the local counterpart of encode_pcap
+
+    Yields:
+        the same 4-tuples (src, dst, dbms, timestamp) as pcap_frames
+    """
+    with gzip.open(str(encoded_name), 'rb') as encoded:
+        contents = encoded.read()
+    if not contents.startswith(COMPACT_MAGIC):
+        raise ValueError("{}: not a compact capture".format(encoded_name))
+    for timestamp, src, dst, count, *dbms in compact_record.iter_unpack(
+            memoryview(contents)[len(COMPACT_MAGIC):]):
+        yield ip_address(src), ip_address(dst), tuple(dbms[:count]), timestamp
+
+
+def times_name(node_id):
+    """
+    the file where process_pcap and process_encoded store the capture
+    timestamps of the frames in result-<N>.txt, one native float64
+    per line of that file; tshark on the nodes produces none
+    """
+    return "times-{}.bin".format(node_id)
+
+
+def _write_results(run_root, node_id, frames):
+    """
+    writes result-<N>.txt and times-<N>.bin from 4-tuples
+    (src, dst, dbms, timestamp)
+
+    Returns:
+        the number of frames written
+    """
+    run_root = Path(run_root)
+    result_name = run_root / "result-{}.txt".format(node_id)
+    timestamps = array('d')
+    with result_name.open('w') as result_file:
+        for src, dst, dbms, timestamp in frames:
+            result_file.write("{}\t{}\t{}\n".format(
+                src, dst, ",".join(str(dbm) for dbm in dbms)))
+            timestamps.append(timestamp)
+    with (run_root / times_name(node_id)).open('wb') as times_file:
+        timestamps.tofile(times_file)
+    return len(timestamps)
+
+
+def process_pcap(run_root, node_id):
+    """
+    the local counterpart of process-pcap in node-utilities.sh
+
+    reads fit<N>.pcap in run_root and writes result-<N>.txt
+    in the same format as tshark would, plus the capture
+    timestamps in times-<N>.bin
+
+    Returns:
+        the number of frames retained
+    """
+    pcap_name = Path(run_root) / "fit{}.pcap".format(node_id)
+    return _write_results(
+        run_root, node_id,
+        pcap_frames(pcap_name, dst="10.0.0.{}".format(node_id)))
+
+
+def process_encoded(run_root, node_id):
+    """
+    same as process_pcap, but from the fit<N>.rssi.gz file
+    produced on the node by encode_pcap
+    """
+    encoded_name = Path(run_root) / "fit{}.rssi.gz".format(node_id)
+    dst = "10.0.0.{}".format(node_id)
+    return _write_results(
+        run_root, node_id,
+        (frame for frame in decode_records(encoded_name) if frame[1] == dst))
+
+
+def process_pcaps(run_root, node_ids, max_workers=None):
+    """
+    runs process_pcap on all nodes, using a pool of processes
+
+    Returns:
+        a dictionary node_id -> number of frames
+    """
+    node_ids = list(node_ids)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        counts = executor.map(process_pcap,
+                              [run_root] * len(node_ids), node_ids)
+        return dict(zip(node_ids, counts))
+
+
+def main():
+    """
+    (re)computes the result-<N>.txt files from the fit<N>.pcap files
+    in one or several run directories, like e.g. datasample/t5-r1-a7-ch1
+
+    with --encode, reduces one pcap file into a compact capture instead;
+    this is what runs on the nodes
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-e", "--encode", nargs=2, default=None,
+                        metavar=('PCAP', 'ENCODED'),
+                        help="encode one pcap file into a compact capture")
+    parser.add_argument("-D", "--dst", default=None,
+                        help="with --encode, only keep frames sent"
+                        " to this IP address")
+    parser.add_argument("-N", "--node-id", dest='node_ids', type=int,
+                        action='append', default=None,
+                        help="restrict to these node ids - "
+                        "default is to use all fit<N>.pcap files")
+    parser.add_argument("-j", "--jobs", default=None, type=int,
+                        help="number of worker processes, "
+                        "default is the number of cores")
+    parser.add_argument("run_roots", nargs='*',
+                        help="directories where pcap files were pulled")
+    args = parser.parse_args()
+
+    if args.encode:
+        pcap_name, encoded_name = args.encode
+        frames = encode_pcap(pcap_name, encoded_name, args.dst)
+        print("{}: {} frames".format(encoded_name, frames))
+        return True
+
+    for run_root in args.run_roots:
+        node_ids = args.node_ids or sorted(
+            int(path.stem[3:]) for path in Path(run_root).glob("fit*.pcap"))
+        counts = process_pcaps(run_root, node_ids, args.jobs)
+        for node_id, frames in counts.items():
+            print("{}: result-{}.txt - {} frames"
+                  .format(run_root, node_id, frames))
+    return True
+
+
+if __name__ == '__main__':
+    exit(0 if main() else 1)
@@ -0,0 +1,322 @@
+"""
+Estimating how long a campaign will take, for acquiremap --dry-run
+
+Each config goes through the same phases as in jobtimer: checking the
+lease, loading images, initializing (or reconfiguring) the wifi
+interfaces, letting the network settle, the pings, retrieving the
+captures, and aggregating; the pings are estimated from the ping
+parameters, the number of pairs and the scheduling strategy, while
+the other phases come from the timing.json files of previous runs,
+or from default_durations when there is no history
+
+Two things the estimate takes into account:
+* ping is called with -w ping_timeout, so each ping lasts at most
+  that long, regardless of ping_number x ping_interval
+* the jobs window of the scheduler also counts the tcpdump jobs,
+  that run until the pings are over; so with --parallel P, only
+  P - (number of nodes) pings can run at the same time
+
+On top of the estimates, the plan recommends a --parallel value, and
+an order for the configs that minimizes the number of times the nodes
+have to leave and join the ad-hoc cell again with --reconfigure
+"""
+
+import heapq
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from jobtimer import timing_name
+from runstore import config_name
+from pairscheduler import ping_rounds
+
+# in seconds, for phases with no history
+# init-ad-hoc-network sleeps randomly up to 100s, then waits 10s;
+# a rejoin sleeps randomly up to 20s, then waits 12s
+default_durations = dict(connections=2., lease=3., load=300., init=120.,
+                         reconfigure=3., rejoin=32., retrieve=10.,
+                         aggregate=2., ping_overhead=2.)
+
+# the columns of the plan, in the order of a run
+plan_phases = ("connections", "lease", "load", "init", "settle",
+               "pings", "retrieve", "aggregate")
+
+# testbed leases are booked in slots of that many seconds
+lease_slot = 60 * 60
+
+
+def load_history(run_names, ping_timeout, ping_number, ping_interval):
+    """
+    gathers the median duration of each phase on the critical path,
+    from the timing.json files of all configs in run_names
+
+    the pings are accounted for differently: the returned ping_overhead
+    is the median time that a 'ping i -> j' job takes on top of the
+    ping itself, i.e. for the ssh session, the script upload and the pull
+
+    Returns:
+        a tuple (durations, configs) with a dict phase -> seconds,
+        and the number of configs found
+    """
+    samples = {}
+    configs = 0
+    ping_time = min(ping_timeout, ping_number * ping_interval)
+    for run_name in run_names:
+        for timing in sorted(Path(run_name).glob("*/" + timing_name)):
+            with timing.open() as timing_file:
+                trace = json.load(timing_file)
+            configs += 1
+            for phase in trace['otherData']['phases']:
+                if phase['critical'] > 0:
+                    samples.setdefault(phase['phase'], []).append(
+                        phase['critical'])
+            for event in trace['traceEvents']:
+                if event['name'].startswith("ping "):
+                    samples.setdefault('ping_overhead', []).append(
+                        max(event['dur'] / 1e6 - ping_time, 0.))
+    durations = {phase: float(np.median(values))
+                 for phase, values in samples.items()}
+    return durations, configs
+
+
+def list_schedule(durations, slots):
+    """
+    how long it takes to run jobs with durations, in this order,
+    with at most slots jobs at the same time, each job starting
+    as soon as a slot is free - which is what a jobs window does
+    """
+    if slots <= 0:
+        return math.inf
+    ends = [0.] * min(slots, len(durations))
+    for duration in durations:
+        heapq.heappush(ends, heapq.heappop(ends) + duration)
+    return max(ends, default=0.)
+
+
+def pings_duration(node_ids, *, parallel, rounds, batch, ping_time,
+                   ping_overhead, nb_rounds=None):
+    """
+    the estimated duration of the pings phase, in seconds
+
+    Parameters:
+        ping_time: the duration of one ping between 2 nodes
+        nb_rounds: the number of rounds computed by pairscheduler,
+          required if rounds is set
+    """
+    node_ids = sorted(node_ids)
+    if batch:
+        # one job per source, that pings all its destinations in turn
+        durations = [(len(node_ids) - 1 - rank) * ping_time + ping_overhead
+                     for rank in range(len(node_ids) - 1)]
+    else:
+        pairs = len(node_ids) * (len(node_ids) - 1) // 2
+        if rounds:
+            return nb_rounds * (ping_time + ping_overhead)
+        durations = [ping_time + ping_overhead] * pairs
+    if parallel is None:
+        return sum(durations)
+    if parallel == 0:
+        return max(durations, default=0.)
+    return list_schedule(durations, parallel - len(node_ids))
+
+
+def config_order(configs):
+    """
+    reorders configs so that the ones with the same channel and antenna
+    mask - whose changes mean leaving and joining the cell again -
+    come together; groups and configs within a group keep their order
+    """
+    groups = {}
+    for config in configs:
+        groups.setdefault((config[2], config[3]), []).append(config)
+    return [config for group in groups.values() for config in group]
+
+
+def rejoins(configs):
+    """
+    the number of times the nodes leave and join the cell again
+    when going through configs with reconfigure-ad-hoc-network
+    """
+    return sum(1 for before, after in zip(configs, configs[1:])
+               if before[2:] != after[2:])
+
+
+class CampaignPlan:
+
+    """
+    the estimated duration of each phase of each config in a campaign
+
+    Parameters:
+        configs: the (tx_power, phy_rate, antenna_mask, channel) tuples,
+          in the order they will run
+        node_ids: the nodes involved
+        history: a dict phase -> seconds, see load_history; phases that
+          are not in there use default_durations
+        settle_delay: the time waited before the pings
+        ping_timeout, ping_number, ping_interval: the ping parameters
+        load_images, reconfigure, parallel, rounds, batch: as in all_runs
+        rounds_reference: as in one_run; the number of rounds depends
+          on it, see pairscheduler
+        lease_period: when connections are kept, how often the lease
+          gets checked; None means at every config
+    """
+
+    def __init__(self, configs, node_ids, *, history, settle_delay,
+                 ping_timeout, ping_number, ping_interval,
+                 load_images=False, reconfigure=False, parallel=None,
+                 rounds=False, rounds_reference=None, batch=False,
+                 lease_period=None):
+        self.configs = list(configs)
+        self.node_ids = sorted(int(id) for id in node_ids)
+        self.durations = dict(default_durations, **history)
+        self.settle_delay = settle_delay
+        self.ping_time = min(ping_timeout, ping_number * ping_interval)
+        self.load_images = load_images
+        self.reconfigure = reconfigure
+        self.parallel = parallel
+        self.rounds = rounds
+        self.batch = batch
+        self.lease_period = lease_period
+        self.nb_rounds = len(ping_rounds(
+            self.node_ids, reference=rounds_reference)) \
+            if len(self.node_ids) > 1 else 0
+        self.estimates = self.estimate(self.configs)
+
+    def pings(self, parallel=None, rounds=False):
+        return pings_duration(
+            self.node_ids, parallel=parallel, rounds=rounds, batch=self.batch,
+            ping_time=self.ping_time,
+            ping_overhead=self.durations['ping_overhead'],
+            nb_rounds=self.nb_rounds)
+
+    def estimate(self, configs):
+        """
+        Returns:
+            a list of dicts phase -> seconds, one per config
+        """
+        estimates = []
+        since_lease = None
+        for index, config in enumerate(configs):
+            phases = dict.fromkeys(plan_phases, 0.)
+            if self.lease_period is not None:
+                phases['connections'] = self.durations['connections']
+            if since_lease is None or self.lease_period is None \
+                    or since_lease > self.lease_period:
+                phases['lease'] = self.durations['lease']
+                since_lease = 0.
+            if index == 0 and self.load_images:
+                phases['load'] = self.durations['load']
+            if index == 0 or not self.reconfigure:
+                phases['init'] = self.durations['init']
+            else:
+                phases['init'] = self.durations['reconfigure']
+                if config[2:] != configs[index - 1][2:]:
+                    phases['init'] += self.durations['rejoin']
+            phases['settle'] = self.settle_delay
+            phases['pings'] = self.pings(self.parallel, self.rounds)
+            phases['retrieve'] = self.durations['retrieve']
+            phases['aggregate'] = self.durations['aggregate']
+            if self.lease_period is not None:
+                since_lease += sum(phases.values())
+            estimates.append(phases)
+        return estimates
+
+    def total(self):
+        return sum(sum(phases.values()) for phases in self.estimates)
+
+    def recommended_parallel(self):
+        """
+        Returns:
+            a tuple (parallel, concurrent): the --parallel value
+            so that as many pings as in an average round of
+            pairscheduler can run at the same time; running more
+            pings at once means some of them are close to each other
+        """
+        pairs = len(self.node_ids) * (len(self.node_ids) - 1) // 2
+        concurrent = max(pairs // max(self.nb_rounds, 1), 1)
+        return len(self.node_ids) + concurrent, concurrent
+
+    def recommendations(self):
+        """
+        Returns:
+            a list of one-line strings
+        """
+        lines = []
+        if self.parallel and self.parallel <= len(self.node_ids):
+            lines.append(
+                "--parallel {} cannot work: the {} tcpdump jobs take up"
+                " all the slots, and the pings would never start"
+                .format(self.parallel, len(self.node_ids)))
+        parallel, concurrent = self.recommended_parallel()
+        strategies = [("sequential", self.pings())]
+        if not self.batch:
+            strategies.append(("--rounds", self.pings(rounds=True)))
+        strategies.append(("--parallel {}".format(parallel),
+                           self.pings(parallel)))
+        best = min(strategies, key=lambda strategy: strategy[1])
+        lines.append(
+            "pings, per config: {}; --parallel {} runs {} pings at once,"
+            " the average round size; best is {}"
+            .format(", ".join("{} {:.0f}s".format(*strategy)
+                              for strategy in strategies),
+                    parallel, concurrent, best[0]))
+        ordered = config_order(self.configs)
+        before, after = rejoins(self.configs), rejoins(ordered)
+        if after < before:
+            saving = (before - after) * self.durations['rejoin']
+            lines.append(
+                "order: grouping configs by channel and antenna mask"
+                " takes {} rejoins instead of {} with --reconfigure,"
+                " about {:.0f}s less".format(after, before, saving))
+        if not self.reconfigure and len(self.configs) > 1:
+            saving = (len(self.configs) - 1) * (
+                self.durations['init'] - self.durations['reconfigure']) \
+                - after * self.durations['rejoin']
+            lines.append("--reconfigure would save about {:.0f}s"
+                         .format(saving))
+        return lines
+
+    def report(self):
+        """
+        the plan, as a printable table followed by recommendations
+        """
+        header = "{:<16}".format("config") + "".join(
+            "{:>12}".format(phase) for phase in plan_phases) \
+            + "{:>10}{:>6}".format("total", "slot")
+        lines = [header]
+        elapsed = 0.
+        for config, phases in zip(self.configs, self.estimates):
+            elapsed += sum(phases.values())
+            lines.append(
+                "{:<16}".format(config_name(config))
+                + "".join("{:>12.0f}".format(phases[phase])
+                          for phase in plan_phases)
+                + "{:>10.0f}{:>6}".format(sum(phases.values()),
+                                          slots(elapsed)))
+        total = self.total()
+        lines.append("campaign: {} configs on {} nodes, {:.0f}s i.e. {}"
+                     " - {} slot(s) of {} min"
+                     .format(len(self.configs), len(self.node_ids), total,
+                             hms(total), slots(total), lease_slot // 60))
+        lines.extend("* " + line for line in self.recommendations())
+        return "\n".join(lines)
+
+
+def slots(seconds):
+    """
+    how many lease slots it takes to last that long
+    """
+    return "-" if math.isinf(seconds) else max(math.ceil(seconds / lease_slot), 1)
+
+
+def hms(seconds):
+    """
+    seconds as h:mm:ss
+    """
+    if math.isinf(seconds):
+        return "never"
+    seconds = round(seconds)
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds // 60 % 60,
+                                     seconds % 60)
@@ -1,7 +1,23 @@
+#!/usr/bin/env python3
+
 """
 helper tools for aggregating (averaging) multiple rssi reports
+
+can also be used from the command line, to recompute
+the RSSI.txt files of an existing run, see main()
 """
 
+import threading
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from rssi import list_configs, statistics_names
+from samplestore import SampleCollector, samples_name
+from pcapreader import times_name
+
 class Averager:
     """
     For each couple (receiver, sender) we gather
@@ -105,3 +121,497 @@ class Aggregator:
                     sender, receiver)
                 line += "\t".join("{0:.2f}".format(v) for v in avgs)
                 aggregate_file.write(line + "\n")
+
+
+########################################
+# vectorized flavour
+#
+# Aggregator above deals with one packet at a time, and with N**2
+# Averager objects; this is fine for small runs, but campaigns
+# produce millions of captured frames per config
+# what follows parses result files in bulk as integer arrays,
+# and reduces them with grouped sums and counts
+
+# turn '10.0.0.1\t10.0.0.2\t-40,-42' into '10 0 0 1\t10 0 0 2\t-40 -42'
+_result_separators = str.maketrans('.,', '  ')
+
+
+def load_result(result_name, columns):
+    """
+    parses one result-<N>.txt file as produced by process-pcap
+
+    Parameters:
+        result_name: a pathlib Path
+        columns: the number of rssi values to retain for each frame
+
+    Returns:
+        a tuple senders, receivers, rssis of numpy arrays; senders
+        and receivers hold node ids (last byte of the IP address), and
+        rssis has shape (number_of_frames, columns)
+    """
+    text = result_name.read_text().translate(_result_separators).strip()
+    if not text:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros((0, columns), dtype=np.int64))
+    nb_lines = text.count('\n') + 1
+    # 4 bytes for each IP address, and then the rssi values
+    width = len(text.partition('\n')[0].split())
+    # frames do not all report the same number of antennas, so the
+    # number of values is checked on each line before reshaping
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    blank = chars <= ord(' ')
+    starts = ~blank
+    starts[1:] &= blank[:-1]
+    line_starts = np.r_[0, np.flatnonzero(chars == ord('\n')) + 1]
+    line_widths = np.add.reduceat(starts.view(np.uint8), line_starts,
+                                  dtype=np.int64)
+    if width >= 8 + columns and np.all(line_widths == width):
+        values = np.fromstring(text, dtype=np.int64, sep=' ')
+        values = values.reshape(nb_lines, width)
+    else:
+        # lines are not all alike, go for the slow path
+        values = np.array([[int(x) for x in line.split()[:8 + columns]]
+                           for line in text.splitlines()], dtype=np.int64)
+    return values[:, 3], values[:, 7], values[:, 8:8 + columns]
+
+
+def write_rssi(aggregate_name, node_ids, averages):
+    """
+    writes a RSSI.txt file from a [sender, receiver, column] array
+    where sender and receiver are ranks in node_ids
+
+    a temporary file is renamed, so that readers never see a half-written
+    file, and an existing file is left untouched if anything goes wrong
+    """
+    temporary = aggregate_name.with_suffix(".tmp")
+    with temporary.open("w") as aggregate_file:
+        for s, sender in enumerate(node_ids):
+            for r, receiver in enumerate(node_ids):
+                line = "10.0.0.{:02d}\t10.0.0.{:02d}\t".format(
+                    sender, receiver)
+                line += "\t".join("{0:.2f}".format(v)
+                                  for v in averages[s, r].tolist())
+                aggregate_file.write(line + "\n")
+    temporary.replace(aggregate_name)
+
+
+class LinkStatistics:
+
+    """
+    fixed-memory statistics on the rssi values of all links,
+    beyond the plain averages
+
+    for each (link, column) we keep
+    * the number of frames, the mean and the sum of squared deviations,
+      that are merged chunk by chunk (Welford/Chan), for the variance
+    * the min and max values
+    * a histogram with one bin per dBm, from which quantiles are derived;
+      as the dBm values are integers, these quantiles are exact
+
+    all these are numpy arrays indexed by [link, column], where
+    link is sender_rank * nb_nodes + receiver_rank
+    """
+
+    # dBm values outside of this range are clipped in the histograms
+    DBM_MIN = -128
+    DBM_MAX = 0
+
+    def __init__(self, nb_nodes, columns):
+        size = nb_nodes * nb_nodes
+        self.nb_nodes = nb_nodes
+        self.columns = columns
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.means = np.zeros((size, columns))
+        self.m2s = np.zeros((size, columns))
+        self.minima = np.full((size, columns), np.iinfo(np.int16).max,
+                              dtype=np.int16)
+        self.maxima = np.full((size, columns), np.iinfo(np.int16).min,
+                              dtype=np.int16)
+        bins = self.DBM_MAX - self.DBM_MIN + 1
+        self.histograms = np.zeros((size, columns, bins), dtype=np.int32)
+
+    def update(self, links, rssis):
+        """
+        accumulates a chunk of frames
+
+        Parameters:
+            links: the link index of each frame
+            rssis: the values, with shape (number_of_frames, columns)
+        """
+        if not len(links):
+            return
+        size = len(self.counts)
+        counts = np.bincount(links, minlength=size)
+        total = np.maximum(self.counts + counts, 1)
+        for column in range(self.columns):
+            values = rssis[:, column].astype(float)
+            chunk_means = np.bincount(links, weights=values, minlength=size) \
+                / np.maximum(counts, 1)
+            chunk_m2s = np.bincount(
+                links, weights=(values - chunk_means[links]) ** 2,
+                minlength=size)
+            delta = chunk_means - self.means[:, column]
+            self.means[:, column] += delta * counts / total
+            self.m2s[:, column] += chunk_m2s \
+                + delta ** 2 * self.counts * counts / total
+        self.counts += counts
+
+        # min and max, over frames sorted by link
+        order = np.argsort(links, kind='stable')
+        sorted_links = links[order]
+        starts = np.flatnonzero(
+            np.r_[True, sorted_links[1:] != sorted_links[:-1]])
+        groups = sorted_links[starts]
+        sorted_rssis = rssis[order]
+        self.minima[groups] = np.minimum(
+            self.minima[groups],
+            np.minimum.reduceat(sorted_rssis, starts, axis=0))
+        self.maxima[groups] = np.maximum(
+            self.maxima[groups],
+            np.maximum.reduceat(sorted_rssis, starts, axis=0))
+
+        bins = self.histograms.shape[2]
+        offsets = np.clip(rssis, self.DBM_MIN, self.DBM_MAX) - self.DBM_MIN
+        cells = (links[:, np.newaxis] * self.columns
+                 + np.arange(self.columns)) * bins + offsets
+        self.histograms += np.bincount(
+            cells.ravel(), minlength=self.histograms.size)\
+            .reshape(self.histograms.shape).astype(np.int32)
+
+    def stds(self):
+        """
+        the standard deviations (with n-1 degrees of freedom),
+        NaN for links without frames
+        """
+        counts = self.counts[:, np.newaxis]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 1,
+                            np.sqrt(self.m2s / np.maximum(counts - 1, 1)),
+                            np.where(counts == 1, 0., np.nan))
+
+    def quantile(self, q):
+        """
+        the smallest value v such that a fraction q of the frames
+        are <= v; NaN for links without frames
+        """
+        cumulated = np.cumsum(self.histograms, axis=2)
+        targets = np.maximum(np.ceil(q * self.counts), 1)
+        bins = np.argmax(
+            cumulated >= targets[:, np.newaxis, np.newaxis], axis=2)
+        return np.where(self.counts[:, np.newaxis] > 0,
+                        bins + self.DBM_MIN, np.nan)
+
+    def summary(self):
+        """
+        a [link, column, statistic] array, with statistics
+        in the order of rssi.statistics_names
+        """
+        present = self.counts[:, np.newaxis] > 0
+        by_name = dict(
+            std=self.stds(),
+            min=np.where(present, self.minima, np.nan),
+            p10=self.quantile(0.1),
+            median=self.quantile(0.5),
+            p90=self.quantile(0.9),
+            max=np.where(present, self.maxima, np.nan),
+        )
+        return np.stack([by_name[name] for name in statistics_names], axis=2)
+
+
+def write_statistics(statistics_name, node_ids, statistics):
+    """
+    writes a RSSI-stats.txt file from a LinkStatistics instance
+
+    one line per link like in RSSI.txt, with the number of frames,
+    and then for each rssi rank, all the statistics_names
+    """
+    summary = statistics.summary()
+    counts = statistics.counts.tolist()
+    temporary = statistics_name.with_suffix(".tmp")
+    with temporary.open("w") as statistics_file:
+        statistics_file.write("# sender\treceiver\tcount\t{}\n".format(
+            "\t".join(statistics_names)))
+        for s, sender in enumerate(node_ids):
+            for r, receiver in enumerate(node_ids):
+                link = s * len(node_ids) + r
+                line = "10.0.0.{:02d}\t10.0.0.{:02d}\t{}\t".format(
+                    sender, receiver, counts[link])
+                line += "\t".join("{0:.2f}".format(v)
+                                  for v in summary[link].ravel().tolist())
+                statistics_file.write(line + "\n")
+    temporary.replace(statistics_name)
+
+
+class ArrayAggregator:
+
+    """
+    a drop-in replacement for Aggregator, that produces
+    the exact same RSSI.txt
+
+    all result files are loaded as numpy arrays, and accumulated
+    into dense counts and totals, indexed by
+    [sender, receiver] and [sender, receiver, column]
+    where sender and receiver are ranks in node_ids
+    """
+
+    mask_to_number = Aggregator.mask_to_number
+
+    RSSI_MAX = Aggregator.RSSI_MAX
+    RSSI_MIN = Aggregator.RSSI_MIN
+
+    def __init__(self, run_root, node_ids, antenna_mask, wireless_driver,
+                 statistics=False, samples=False):
+        """
+        run_root should be a pathlib Path
+
+        if statistics is set, more details on each link are
+        computed and written in RSSI-stats.txt, see LinkStatistics
+
+        if samples is set, all individual values are kept as well,
+        and saved in RSSI-samples.npz, see samplestore
+        """
+        self.run_root = run_root
+        self.node_ids = [int(id) for id in node_ids]
+        self.antenna_mask = antenna_mask
+        if wireless_driver == 'ath9k':
+            self.nb_antennas = self.mask_to_number[antenna_mask]
+        else:
+            self.nb_antennas = 0
+        self.columns = self.nb_antennas + 1
+        nb_nodes = len(self.node_ids)
+        # node_id -> rank in node_ids, or -1
+        self.ranks = np.full(256, -1, dtype=np.int64)
+        self.ranks[self.node_ids] = np.arange(nb_nodes)
+        self.counts = np.zeros((nb_nodes, nb_nodes), dtype=np.int64)
+        # totals are sums of integers, so they remain exact as floats
+        self.totals = np.zeros((nb_nodes, nb_nodes, self.columns))
+        self.statistics = LinkStatistics(nb_nodes, self.columns) \
+            if statistics else None
+        self.samples = SampleCollector(self.node_ids, self.columns) \
+            if samples else None
+
+    def fold(self, sender):
+        """
+        accumulates the contents of result-<sender>.txt
+        """
+        result_name = self.run_root / "result-{}.txt".format(sender)
+        senders, receivers, rssis = load_result(result_name, self.columns)
+        times = None
+        times_path = self.run_root / times_name(sender)
+        if self.samples is not None and times_path.exists():
+            times = np.fromfile(str(times_path), dtype=np.float64)
+            if len(times) != len(senders):
+                times = None
+        self.fold_arrays(senders, receivers, rssis, times)
+
+    def fold_arrays(self, senders, receivers, rssis, times=None):
+        """
+        accumulates frames, given as arrays like the ones
+        returned by load_result
+
+        times are only used when samples are kept; fold passes the
+        capture timestamps when pcap files were processed locally,
+        see pcapreader.times_name; they default to the rank of each
+        frame otherwise
+        """
+        nb_nodes = len(self.node_ids)
+        sender_ranks = self.ranks[senders]
+        receiver_ranks = self.ranks[receivers]
+        # ignore frames from or to nodes that are not in node_ids
+        known = (sender_ranks >= 0) & (receiver_ranks >= 0)
+        links = sender_ranks[known] * nb_nodes + receiver_ranks[known]
+        rssis = rssis[known]
+        size = nb_nodes * nb_nodes
+        self.counts += np.bincount(links, minlength=size)\
+            .reshape(nb_nodes, nb_nodes)
+        for column in range(self.columns):
+            self.totals[:, :, column] += np.bincount(
+                links, weights=rssis[:, column], minlength=size)\
+                .reshape(nb_nodes, nb_nodes)
+        if self.statistics is not None:
+            self.statistics.update(links, rssis)
+        if self.samples is not None:
+            if times is None:
+                times = np.arange(len(senders))
+            self.samples.add(links, rssis, np.asarray(times)[known])
+
+    def averages(self):
+        """
+        returns a [sender, receiver, column] array of averages;
+        links with no frame at all get RSSI_MAX on the diagonal
+        and RSSI_MIN elsewhere
+        """
+        nb_nodes = len(self.node_ids)
+        defaults = np.full((nb_nodes, nb_nodes), float(self.RSSI_MIN))
+        np.fill_diagonal(defaults, self.RSSI_MAX)
+        counts = self.counts[:, :, np.newaxis]
+        return np.where(counts > 0,
+                        self.totals / np.maximum(counts, 1),
+                        defaults[:, :, np.newaxis])
+
+    def write(self):
+        """
+        writes RSSI.txt, and RSSI-stats.txt if needed
+        """
+        # consolidated file is called RSSI.txt
+        write_rssi(self.run_root / "RSSI.txt", self.node_ids, self.averages())
+        if self.statistics is not None:
+            write_statistics(self.run_root / "RSSI-stats.txt",
+                             self.node_ids, self.statistics)
+        if self.samples is not None:
+            self.samples.save(self.run_root / samples_name)
+
+    def run(self):
+        """
+        call at the end of one_run
+        """
+        for sender in self.node_ids:
+            self.fold(sender)
+        self.write()
+
+
+class IncrementalAggregator(ArrayAggregator):
+
+    """
+    an ArrayAggregator that is fed one sender at a time, typically
+    as soon as its result file has been pulled, rather than
+    once all nodes are done
+
+    each call to add() publishes the averages so far in RSSI-partial.txt;
+    add() can be called from several threads
+    """
+
+    partial_name = "RSSI-partial.txt"
+
+    def __init__(self, *args, **kwds):
+        super().__init__(*args, **kwds)
+        self.folded = []
+        self.lock = threading.Lock()
+
+    def add(self, sender):
+        """
+        accumulates result-<sender>.txt, and publishes a partial RSSI file
+        """
+        with self.lock:
+            self.fold(sender)
+            self.folded.append(sender)
+            self.publish()
+
+    def publish(self):
+        """
+        (over)writes RSSI-partial.txt, see write_rssi
+        """
+        write_rssi(self.run_root / self.partial_name, self.node_ids,
+                   self.averages())
+
+    def run(self):
+        """
+        folds the senders that have not been added yet if any,
+        writes RSSI.txt and removes the partial file
+        """
+        with self.lock:
+            for sender in self.node_ids:
+                if sender not in self.folded:
+                    self.fold(sender)
+                    self.folded.append(sender)
+            self.write()
+            partial = self.run_root / self.partial_name
+            if partial.exists():
+                partial.unlink()
+
+
+########################################
+# re-aggregating existing runs
+
+def result_node_ids(run_root):
+    """
+    the sorted node ids for which a result-<N>.txt file exists
+    """
+    return sorted(int(path.stem.split('-')[1])
+                  for path in run_root.glob("result-*.txt"))
+
+
+def needs_aggregation(run_root):
+    """
+    True if run_root has result files, and RSSI.txt is either
+    missing or older than one of them
+    """
+    results = list(run_root.glob("result-*.txt"))
+    if not results:
+        return False
+    aggregate_name = run_root / "RSSI.txt"
+    if not aggregate_name.exists():
+        return True
+    aggregated = aggregate_name.stat().st_mtime
+    return any(result.stat().st_mtime > aggregated for result in results)
+
+
+def reaggregate(run_root, antenna_mask, wireless_driver,
+                statistics=False, samples=False):
+    """
+    recomputes RSSI.txt in run_root from all the result files there
+
+    Returns:
+        the number of nodes involved; with no result file,
+        nothing is written and this is 0
+    """
+    run_root = Path(run_root)
+    node_ids = result_node_ids(run_root)
+    if not node_ids:
+        return 0
+    ArrayAggregator(run_root, node_ids, antenna_mask, wireless_driver,
+                    statistics=statistics, samples=samples).run()
+    return len(node_ids)
+
+
+def main():
+    """
+    re-aggregates all configs in one or several runs, skipping
+    the ones whose RSSI.txt is up to date, unless --force is given;
+    configs with no result file are always skipped
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-w", "--wifi-driver", default='ath9k',
+                        choices=['iwlwifi', 'ath9k'],
+                        help="the driver that was used during acquisition")
+    parser.add_argument("-f", "--force", default=False, action='store_true',
+                        help="re-aggregate all configs")
+    parser.add_argument("-s", "--statistics", default=False,
+                        action='store_true',
+                        help="also write RSSI-stats.txt")
+    parser.add_argument("-k", "--keep-samples", default=False,
+                        action='store_true',
+                        help="also write RSSI-samples.npz")
+    parser.add_argument("-j", "--jobs", default=None, type=int,
+                        help="number of worker processes, "
+                        "default is the number of cores")
+    parser.add_argument("run_names", nargs='+')
+    args = parser.parse_args()
+
+    todo = [
+        (config, run_root)
+        for run_name in args.run_names
+        for config, run_root in list_configs(run_name)
+        if args.force and result_node_ids(run_root)
+        or needs_aggregation(run_root)
+    ]
+    print("{} configs to aggregate".format(len(todo)))
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            (run_root, executor.submit(
+                reaggregate, run_root, antenna_mask, args.wifi_driver,
+                args.statistics, args.keep_samples))
+            for (_, _, antenna_mask, _), run_root in todo
+        ]
+        ok = True
+        for run_root, future in futures:
+            try:
+                print("{}: {} nodes".format(run_root, future.result()))
+            except Exception as e:
+                print("{}: could not aggregate: {}".format(run_root, e))
+                ok = False
+    return ok
+
+
+if __name__ == '__main__':
+    exit(0 if main() else 1)
@@ -35,15 +35,12 @@ def init_dataframe():
     returns a dataframe that has the right
     number of lines and columns to depict r2lab nodes
     """
-    index = _node_to_position.keys()
-    columns = ['x', 'y', 'value']
-    df = pd.DataFrame(index = index, columns=columns)
-    for node_id, (x, y) in _node_to_position.items():
-        df.loc[node_id]['x'] = x
-        df.loc[node_id]['y'] = y
-        df.loc[node_id]['value'] = 0
-    return df
-    
+    node_ids = list(_node_to_position.keys())
+    xs, ys = zip(*_node_to_position.values())
+    return pd.DataFrame(dict(x=xs, y=ys, value=0.),
+                        index=node_ids, columns=['x', 'y', 'value'])
+
+
 def fill_dataframe_from_rssi(df, rssi_dict):
     """
     from a rssi dict that comes out of read_rssi
@@ -51,9 +48,33 @@ def fill_dataframe_from_rssi(df, rssi_dict):
 
     returns df
     """
-
-    for node_id, value in rssi_dict.items():
-        df.loc[node_id]['value'] = value
+    df.loc[list(rssi_dict.keys()), 'value'] = list(rssi_dict.values())
     return df
 
 
+def patch_source(source, df, rssi_dict):
+    """
+    for animations: like fill_dataframe_from_rssi, but also
+    sends the values that have changed to a bokeh ColumnDataSource,
+    as a single source.patch() call
+
+    source is expected to have been created with ColumnDataSource(df),
+    so that its rows are in the same order as df
+
+    node ids in rssi_dict that are not in df are ignored
+
+    returns the number of patched rows
+    """
+    node_ids = np.fromiter(rssi_dict.keys(), dtype=int, count=len(rssi_dict))
+    values = np.fromiter(rssi_dict.values(), dtype=float,
+                         count=len(rssi_dict))
+    rows = df.index.get_indexer(node_ids)
+    # get_indexer returns -1 for unknown ids
+    known = rows >= 0
+    rows, values = rows[known], values[known]
+    changed = df['value'].to_numpy()[rows] != values
+    rows, values = rows[changed], values[changed]
+    if len(rows):
+        df.iloc[rows, df.columns.get_loc('value')] = values
+        source.patch({'value': list(zip(rows.tolist(), values.tolist()))})
+    return len(rows)
@@ -0,0 +1,145 @@
+"""
+Interpolating radiomaps over a fine grid
+
+Rather than showing 37 points with holes set to -100, we can
+interpolate received power over the whole room, using inverse distance
+weighting (IDW) over the node positions
+
+The weights only depend on the layout and on the interpolation
+settings; they are computed once as a (grid cells x nodes) matrix,
+so that interpolating one map - or a whole batch of maps for all
+senders and configs - is a single matrix product
+
+Coordinates are the ones used in r2labplotly, i.e. x in 1..9 and y in 1..5
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+import r2labmap
+from r2labplotly import plotx, ploty
+
+_node_to_position, _, _ = r2labmap.maps(plotx, ploty)
+
+# nodes in this order along the last axis of maps
+node_ids = sorted(_node_to_position)
+
+
+def _grid(resolution):
+    """
+    the coordinates of the fine grid, and the (cells x nodes)
+    array of distances between cells and nodes
+    """
+    positions = np.array([_node_to_position[node_id] for node_id in node_ids],
+                         dtype=float)
+    xs = np.linspace(1, 9, 8 * resolution + 1)
+    ys = np.linspace(1, 5, 4 * resolution + 1)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    cells = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1)
+    distances = np.linalg.norm(
+        cells[:, np.newaxis, :] - positions[np.newaxis, :, :], axis=2)
+    return xs, ys, distances
+
+
+def _idw(distances, power, neighbours):
+    """
+    the normalized IDW weights for a (cells x nodes) array of distances
+    """
+    with np.errstate(divide='ignore'):
+        weights = 1 / distances ** power
+    # cells that are right on a node take that node's value
+    on_node = distances == 0
+    weights[on_node.any(axis=1)] = 0
+    weights[on_node] = 1
+    if neighbours is not None and neighbours < len(node_ids):
+        farther = np.argsort(distances, axis=1)[:, neighbours:]
+        np.put_along_axis(weights, farther, 0, axis=1)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights
+
+
+@lru_cache(maxsize=16)
+def idw_weights(resolution=10, power=2, neighbours=8):
+    """
+    computes the interpolation weights for one layout
+
+    Parameters:
+        resolution: number of grid cells between 2 adjacent nodes
+        power: the IDW exponent
+        neighbours: only that many nearest nodes are used for
+          each cell, all nodes are used if None
+
+    Returns:
+        a tuple xs, ys, weights where xs and ys are the coordinates
+        of the fine grid, and weights has shape (len(ys) * len(xs),
+        len(node_ids)) - most of it is zero when neighbours is set;
+        the returned arrays are cached and must not be modified
+    """
+    xs, ys, distances = _grid(resolution)
+    weights = _idw(distances, power, neighbours)
+    for array in (xs, ys, weights):
+        array.setflags(write=False)
+    return xs, ys, weights
+
+
+@lru_cache(maxsize=16)
+def on_node_weights(resolution=10, power=2, neighbours=8):
+    """
+    the weights to use instead of idw_weights for the cells that are
+    right on a node, when that node has no value: the same IDW, but
+    over the neighbours of the node, as if it were not there
+
+    Returns:
+        a tuple cells, nodes, weights, where cells are the indices of
+        these cells in the grid, nodes the ranks of the nodes they are
+        on, and weights has shape (len(cells), len(node_ids));
+        the returned arrays are cached and must not be modified
+    """
+    _, _, distances = _grid(resolution)
+    cells, nodes = np.nonzero(distances == 0)
+    distances = distances[cells]
+    distances[np.arange(len(cells)), nodes] = np.inf
+    weights = _idw(distances, power, neighbours)
+    for array in (cells, nodes, weights):
+        array.setflags(write=False)
+    return cells, nodes, weights
+
+
+def interpolate(values, **settings):
+    """
+    interpolates one or several maps
+
+    Parameters:
+        values: an array whose last dimension is indexed like node_ids;
+          NaN values are ignored, i.e. weights are renormalized
+          over the nodes that have a value, and the cell right on
+          a node with no value is interpolated from the neighbours
+          of that node; cells whose neighbours all are NaN come
+          out as NaN
+        settings: passed to idw_weights
+
+    Returns:
+        a tuple xs, ys, Z where Z has shape
+        values.shape[:-1] + (len(ys), len(xs))
+    """
+    xs, ys, weights = idw_weights(**settings)
+    values = np.asarray(values, dtype=float)
+    known = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Z = (np.where(known, values, 0) @ weights.T) / (known @ weights.T)
+        cells, nodes, fallback = on_node_weights(**settings)
+        Z[..., cells] = np.where(
+            known[..., nodes], Z[..., cells],
+            (np.where(known, values, 0) @ fallback.T) / (known @ fallback.T))
+    return xs, ys, Z.reshape(values.shape[:-1] + (len(ys), len(xs)))
+
+
+def interpolate_rssi(rssi_dict, **settings):
+    """
+    same as interpolate, for a dictionary node_id -> value
+    as returned by read_rssi
+    """
+    values = np.array([rssi_dict.get(node_id, np.nan)
+                       for node_id in node_ids], dtype=float)
+    return interpolate(values, **settings)
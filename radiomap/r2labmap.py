@@ -5,6 +5,8 @@ depending on the tool, several orientations / numberings
 may be needed; this is done through so-called swap function
 """
 
+import numpy as np
+
 # the numbers as we display them in livemap
 r2labmap = [
     [1,  6, 11, 16,   19,   23,   26, 31, None],
@@ -57,3 +59,33 @@ def maps(sx, sy):
 
     return node_to_position, position_to_node, holes
 
+
+def grid(sx, sy):
+    """
+    compiles the geometry into numpy arrays, so that maps can be
+    filled with a single fancy-indexing assignment
+
+    the grid is a 2D array indexed by [row, column] where row and
+    column are sy(y) and sx(x), shifted so that they start at 0
+
+    returns as a tuple:
+
+    * node_cells is an integer array, node_id -> flat index in the grid
+      (node_cells[0] is -1 as there is no node 0)
+    * hole_mask is a boolean array with the shape of the grid,
+      that is True on holes
+    """
+    node_to_position, _, holes = maps(sx, sy)
+    positions = list(node_to_position.values()) + list(holes)
+    min_x = min(x for x, _ in positions)
+    min_y = min(y for _, y in positions)
+    columns = max(x for x, _ in positions) - min_x + 1
+    rows = max(y for _, y in positions) - min_y + 1
+
+    node_cells = np.full(max(node_to_position) + 1, -1, dtype=int)
+    for node_id, (x, y) in node_to_position.items():
+        node_cells[node_id] = (y - min_y) * columns + (x - min_x)
+    hole_mask = np.zeros((rows, columns), dtype=bool)
+    for x, y in holes:
+        hole_mask[y - min_y, x - min_x] = True
+    return node_cells, hole_mask
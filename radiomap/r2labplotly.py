@@ -21,6 +21,16 @@ def ploty(y):
 _node_to_position, _position_to_node, _holes \
     = r2labmap.maps(plotx, ploty)
 
+# the same, compiled for the 3D grid
+# the grid has shape (5, 9) and its [0, 0] cell is at x=1, y=1
+_node_cells, _hole_mask = r2labmap.grid(plotx, ploty)
+_X, _Y = np.meshgrid(np.arange(1, _hole_mask.shape[1] + 1),
+                     np.arange(1, _hole_mask.shape[0] + 1))
+_labels = np.full(_hole_mask.size, "None", dtype=object)
+for node_id, cell in enumerate(_node_cells):
+    if cell >= 0:
+        _labels[cell] = "fit{:02d}".format(node_id)
+
 #################### for plotly
 def rssi_to_plotly(rssi_dict):
     """
@@ -53,21 +63,37 @@ def rssi_to_plotly3D(rssi_dict):
 
     Returns:
         will return a triple X, Y, Z, T(ext) of numpy arrays for your plotter
+        X and Y are shared between calls and should not be modified
     """
-    # Make X,Y R2lab grid of nodes                                                                    
-    X = np.arange(1, 10, 1, dtype=np.integer)
-    Y = np.arange(1, 6, 1, dtype=np.integer)
-    X, Y = np.meshgrid(X, Y)
-
-    Z = np.zeros((5,9),dtype=np.float)
-    Z[0,3] = Z[0,4] = Z[0,5] = -100 # np.nan
-    Z[3,3] = Z[3,5] = Z[2,8] = Z[3,8] = Z[4,8] = -100 # np.nan
-    T = [ ["None"]*9 for i in range(6) ]
-    for node_id, value in rssi_dict.items():
-        x, y = _node_to_position[node_id]
-        Z[y-1,x-1] = value
-        T[y-1][x-1]="fit{:02d}".format(node_id)
-    return X, Y, Z, T
+    node_ids = np.fromiter(rssi_dict.keys(), dtype=int, count=len(rssi_dict))
+    values = np.fromiter(rssi_dict.values(), dtype=float,
+                         count=len(rssi_dict))
+    Z = rssi_array_to_plotly3D(values, node_ids)
+    present = np.zeros(_hole_mask.size, dtype=bool)
+    present[_node_cells[node_ids]] = True
+    T = np.where(present, _labels, "None").reshape(_hole_mask.shape).tolist()
+    return _X, _Y, Z, T
+
+
+def rssi_array_to_plotly3D(values, node_ids):
+    """
+    the vectorized flavour of rssi_to_plotly3D, that can fill
+    a whole batch of maps at once, e.g. for all senders
+
+    Parameters:
+        values: an array whose last dimension is indexed like node_ids
+        node_ids: the node ids for that last dimension
+
+    Returns:
+        a Z array with shape values.shape[:-1] + (5, 9); holes are
+        set to -100, and nodes not in node_ids to 0
+    """
+    values = np.asarray(values, dtype=float)
+    batch = values.shape[:-1]
+    Z = np.zeros(batch + (_hole_mask.size,))
+    Z[..., _hole_mask.ravel()] = -100 # np.nan
+    Z[..., _node_cells[np.asarray(node_ids, dtype=int)]] = values
+    return Z.reshape(batch + _hole_mask.shape)
 
 ########################################
 if __name__ == '__main__':
@@ -77,4 +103,19 @@ if __name__ == '__main__':
         assert all(_position_to_node[_node_to_position[id]] == id
                    for id in node_ids)
 
+    def test2():
+        # all cells are either a node or a hole
+        cells = _node_cells[1:]
+        assert len(set(cells)) == len(cells)
+        assert not _hole_mask.ravel()[cells].any()
+        assert len(cells) + _hole_mask.sum() == _hole_mask.size
+        # batches are filled like single maps
+        node_ids = list(range(1, 38))
+        batch = np.random.uniform(-90, -30, (37, 37))
+        Z = rssi_array_to_plotly3D(batch, node_ids)
+        for sender in (0, 20):
+            _, _, Z1, _ = rssi_to_plotly3D(dict(zip(node_ids, batch[sender])))
+            assert (Z1 == Z[sender]).all()
+
     test1()
+    test2()
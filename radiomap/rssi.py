@@ -5,30 +5,174 @@ helper to read a RSSI.txt file
 maybe should belong in processmap.py
 """
 
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# the per-rank columns in RSSI-stats.txt, see processmap.LinkStatistics
+statistics_names = ('std', 'min', 'p10', 'median', 'p90', 'max')
+
+# the reverse of naming_scheme in acquiremap.py
+config_pattern = re.compile(r"t(?P<tx_power>\d+)-r(?P<phy_rate>\d+)"
+                            r"-a(?P<antenna_mask>\d+)-ch(?P<channel>\d+)")
+
 def read_rssi(filename, sender, rssi_rank):
     '''
     read a RSSI file and, given a sender node and
     an rssi_rank, returns a dictionary
     receiver_node_number -> value
+
+    the file is parsed only once, see cached_rssi_matrix
     '''
 
-    node_number_to_value = {}
     try:
-        with open(filename) as in_file:
-            for line in in_file:
-                try:
-                    ip_snd, ip_rcv, *values = line.split()
-                    *_, n_snd = ip_snd.split('.')
-                    *_, n_rcv = ip_rcv.split('.')
-                    n_snd = int(n_snd)
-                    n_rcv = int(n_rcv)
-                    if n_snd != sender:
-                        continue
-                    node_number_to_value[n_rcv] = values[rssi_rank]
-                except IndexError as e:
-                    print("rssi_rank {} not present in values"
-                          .format(rssi_rank))
+        node_ids, ranks, matrix = cached_rssi_matrix(filename)
     except IOError as e:
         print("Cannot open file {}: {}" .format(filename, e))
+        return {}
+    if sender not in ranks:
+        return {}
+    if rssi_rank >= matrix.shape[2]:
+        print("rssi_rank {} not present in values"
+              .format(rssi_rank))
+        return {}
+    values = matrix[ranks[sender], :, rssi_rank].tolist()
+    return {
+        n_rcv: value for n_rcv, value in zip(node_ids, values)
+        if not np.isnan(value)
+    }
+
+
+########## cache
+# parsed RSSI files, most recently used last
+# key is (absolute filename, mtime) so that a rewritten file
+# does not get served from the cache
+_matrix_cache = OrderedDict()
+_cache_counters = dict(hits=0, misses=0)
+cache_maxsize = 64
+
+
+def cached_rssi_matrix(filename):
+    """
+    same as read_rssi_matrix, but parsed files are kept in
+    a LRU cache of at most cache_maxsize entries
+
+    Returns:
+        a tuple node_ids, ranks, matrix, where ranks is a dict
+        node_id -> rank in node_ids
+
+    the returned matrix is shared, and should not be modified
+    """
+    path = Path(filename).resolve()
+    key = (path, path.stat().st_mtime_ns)
+    if key in _matrix_cache:
+        _cache_counters['hits'] += 1
+        _matrix_cache.move_to_end(key)
+        return _matrix_cache[key]
+    _cache_counters['misses'] += 1
+    # forget about previous contents of that same file
+    for stale in [k for k in _matrix_cache if k[0] == path]:
+        del _matrix_cache[stale]
+    node_ids, matrix = read_rssi_matrix(path)
+    matrix.setflags(write=False)
+    ranks = {node_id: rank for rank, node_id in enumerate(node_ids)}
+    _matrix_cache[key] = node_ids, ranks, matrix
+    while len(_matrix_cache) > cache_maxsize:
+        _matrix_cache.popitem(last=False)
+    return _matrix_cache[key]
+
+
+def cache_info():
+    """
+    a dictionary with the hits and misses counters,
+    as well as the current and maximal cache sizes
+    """
+    return dict(_cache_counters, size=len(_matrix_cache),
+                maxsize=cache_maxsize)
+
+
+def cache_clear():
+    """
+    empties the cache and resets counters
+    """
+    _matrix_cache.clear()
+    _cache_counters.update(hits=0, misses=0)
+
+
+def read_rssi_matrix(filename):
+    """
+    read a whole RSSI file at once
+
+    Returns:
+        a tuple node_ids, matrix where node_ids is the sorted list
+        of nodes that show up in the file, and matrix a numpy array
+        indexed by [sender, receiver, rssi_rank] - sender and receiver
+        being ranks in node_ids; missing values are NaN
+    """
+    rows = []
+    with open(filename) as in_file:
+        for line in in_file:
+            ip_snd, ip_rcv, *values = line.split()
+            *_, n_snd = ip_snd.split('.')
+            *_, n_rcv = ip_rcv.split('.')
+            rows.append((int(n_snd), int(n_rcv), values))
+    node_ids = sorted({n for n_snd, n_rcv, _ in rows for n in (n_snd, n_rcv)})
+    ranks = {node_id: rank for rank, node_id in enumerate(node_ids)}
+    nb_values = max((len(values) for _, _, values in rows), default=0)
+    matrix = np.full((len(node_ids), len(node_ids), nb_values), np.nan)
+    for n_snd, n_rcv, values in rows:
+        matrix[ranks[n_snd], ranks[n_rcv], :len(values)] = \
+            [float(v) for v in values]
+    return node_ids, matrix
+
+
+def read_statistics_matrix(filename):
+    """
+    read a whole RSSI-stats file at once
+
+    Returns:
+        a tuple node_ids, counts, statistics where
+        counts is indexed by [sender, receiver] and
+        statistics by [sender, receiver, rssi_rank, statistic]
+        with statistics in the order of statistics_names
+    """
+    rows = []
+    with open(filename) as in_file:
+        for line in in_file:
+            if line.startswith('#'):
+                continue
+            ip_snd, ip_rcv, count, *values = line.split()
+            *_, n_snd = ip_snd.split('.')
+            *_, n_rcv = ip_rcv.split('.')
+            rows.append((int(n_snd), int(n_rcv), int(count), values))
+    node_ids = sorted({n for n_snd, n_rcv, *_ in rows for n in (n_snd, n_rcv)})
+    ranks = {node_id: rank for rank, node_id in enumerate(node_ids)}
+    nb_ranks = max((len(values) for *_, values in rows),
+                   default=0) // len(statistics_names)
+    counts = np.zeros((len(node_ids), len(node_ids)), dtype=int)
+    statistics = np.full((len(node_ids), len(node_ids), nb_ranks,
+                          len(statistics_names)), np.nan)
+    for n_snd, n_rcv, count, values in rows:
+        counts[ranks[n_snd], ranks[n_rcv]] = count
+        statistics[ranks[n_snd], ranks[n_rcv]] = \
+            np.array([float(v) for v in values]).reshape(nb_ranks, -1)
+    return node_ids, counts, statistics
+
+
+def list_configs(run_name):
+    """
+    scans a run directory for the subdirectories created by naming_scheme
 
-    return node_number_to_value
+    Returns:
+        a sorted list of tuples
+        (tx_power, phy_rate, antenna_mask, channel), path
+        where the 4 settings are ints and path is a pathlib Path
+    """
+    configs = []
+    for path in Path(run_name).iterdir():
+        match = config_pattern.fullmatch(path.name)
+        if match and path.is_dir():
+            configs.append((tuple(int(x) for x in match.groups()), path))
+    return sorted(configs)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+Comparing two runs, typically acquired before and after a hardware change
+
+Both run trees are aligned on their t{t}-r{r}-a{a}-ch{ch} subdirectories,
+and on the union of their nodes; all common configs are then stacked
+in [config, sender, receiver] arrays, so that deltas and their
+significance are computed in a handful of array operations
+
+A change on one link is deemed significant when it is at least
+min_delta dB, and
+* if both runs have RSSI-stats.txt, when the Welch z-score of the
+  difference of the means is above z_threshold
+* otherwise, when it stands out of the other changes in that config,
+  i.e. when its distance to their median is above z_threshold times
+  their (normalized) median absolute deviation
+
+Example:
+    diff = diff_runs('before', 'after')
+    print(diff.report())
+    diff.links[diff.links.significant]
+"""
+
+import warnings
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+import pandas as pd
+
+from rssi import cached_rssi_matrix, read_statistics_matrix, list_configs
+from processmap import Aggregator
+from runstore import config_axes, config_name
+
+# scales a median absolute deviation into a standard deviation
+MAD_SCALE = 1.4826
+
+
+def _stack(paths, node_ids, rssi_rank):
+    """
+    loads one RSSI.txt - and RSSI-stats.txt if present - per path
+
+    Returns:
+        a tuple means, stds, counts of [config, sender, receiver] arrays;
+        stds and counts are None unless all paths have statistics
+    """
+    nb_nodes = len(node_ids)
+    shape = (len(paths), nb_nodes, nb_nodes)
+    means = np.full(shape, np.nan)
+    with_stats = all((path / "RSSI-stats.txt").exists() for path in paths)
+    stds = np.full(shape, np.nan) if with_stats else None
+    counts = np.zeros(shape) if with_stats else None
+    for index, path in enumerate(paths):
+        ids, _, matrix = cached_rssi_matrix(path / "RSSI.txt")
+        if rssi_rank >= matrix.shape[2]:
+            continue
+        nodes = np.searchsorted(node_ids, ids)
+        means[index][np.ix_(nodes, nodes)] = matrix[:, :, rssi_rank]
+        if with_stats:
+            ids, link_counts, statistics = \
+                read_statistics_matrix(path / "RSSI-stats.txt")
+            nodes = np.searchsorted(node_ids, ids)
+            stds[index][np.ix_(nodes, nodes)] = statistics[:, :, rssi_rank, 0]
+            counts[index][np.ix_(nodes, nodes)] = link_counts
+    # links that received nothing
+    means[means <= Aggregator.RSSI_MIN] = np.nan
+    return means, stds, counts
+
+
+class RunDiff:
+
+    """
+    the outcome of diff_runs
+
+    Attributes:
+        links: a DataFrame indexed by config and (sender, receiver), with
+          columns rssi_a, rssi_b, delta, z and significant; links that
+          exist in only one run have a NaN delta
+        nodes: a DataFrame indexed by config and node_id, with the mean
+          delta as a sender and as a receiver, and the number of
+          significant links it is involved in
+        only_a, only_b: the configs that have a RSSI.txt in only one run
+        method: 'welch' or 'mad'
+    """
+
+    def __init__(self, run_a, run_b, links, nodes, only_a, only_b, method):
+        self.run_a, self.run_b = run_a, run_b
+        self.links, self.nodes = links, nodes
+        self.only_a, self.only_b = only_a, only_b
+        self.method = method
+
+    def report(self, top=10):
+        """
+        a short, human-readable, summary
+        """
+        links = self.links
+        lost = links.rssi_a.notna() & links.rssi_b.isna()
+        gained = links.rssi_a.isna() & links.rssi_b.notna()
+        lines = [
+            "{} -> {}: {} common configs, {} links compared ({} method)"
+            .format(self.run_a, self.run_b,
+                    len(links.index.droplevel(['sender', 'receiver'])
+                        .unique()),
+                    links.delta.notna().sum(), self.method),
+            "mean delta {:+.2f} dB, {} significant changes,"
+            " {} links lost, {} links gained"
+            .format(links.delta.mean(), links.significant.sum(),
+                    lost.sum(), gained.sum()),
+        ]
+        for run, configs in ((self.run_a, self.only_a),
+                             (self.run_b, self.only_b)):
+            if configs:
+                lines.append("only in {}: {}".format(
+                    run, " ".join(config_name(c) for c in configs)))
+        drift = self.nodes.groupby(level='node_id')[
+            ['as_sender', 'as_receiver', 'significant']].mean()
+        drift['drift'] = drift[['as_sender', 'as_receiver']].abs().max(axis=1)
+        lines.append("nodes with the largest drift (mean over configs)")
+        # significant is a number of links, not a delta
+        lines.append(drift.sort_values('drift', ascending=False).head(top)
+                     .to_string(float_format="{:+.2f}".format,
+                                formatters=dict(significant="{:.1f}".format)))
+        significant = links[links.significant]
+        if len(significant):
+            lines.append("largest significant changes")
+            lines.append(significant.reindex(
+                significant.delta.abs().sort_values(ascending=False).index)
+                .head(top).to_string(float_format="{:+.2f}".format))
+        return "\n".join(lines)
+
+
+def diff_runs(run_a, run_b, rssi_rank=0, min_delta=1., z_threshold=3.):
+    """
+    compares two runs, see module docstring
+
+    Returns:
+        a RunDiff instance
+    """
+    # configs with no RSSI.txt, e.g. interrupted ones, do not count
+    paths_a = {config: path for config, path in list_configs(run_a)
+               if (path / "RSSI.txt").exists()}
+    paths_b = {config: path for config, path in list_configs(run_b)
+               if (path / "RSSI.txt").exists()}
+    configs = sorted(paths_a.keys() & paths_b.keys())
+    only_a = sorted(paths_a.keys() - paths_b.keys())
+    only_b = sorted(paths_b.keys() - paths_a.keys())
+
+    node_ids = sorted({
+        node_id
+        for paths in (paths_a, paths_b) for config in configs
+        for node_id in cached_rssi_matrix(paths[config] / "RSSI.txt")[0]})
+    nb_nodes = len(node_ids)
+    means_a, stds_a, counts_a = _stack(
+        [paths_a[config] for config in configs], node_ids, rssi_rank)
+    means_b, stds_b, counts_b = _stack(
+        [paths_b[config] for config in configs], node_ids, rssi_rank)
+    off_diagonal = ~np.eye(nb_nodes, dtype=bool)
+    means_a[:, ~off_diagonal] = np.nan
+    means_b[:, ~off_diagonal] = np.nan
+
+    delta = means_b - means_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if stds_a is not None and stds_b is not None:
+            method = 'welch'
+            error = np.sqrt(stds_a ** 2 / counts_a + stds_b ** 2 / counts_b)
+            z = delta / error
+        else:
+            method = 'mad'
+            flat = delta.reshape(len(configs), -1)
+            # nanmedian warns about configs with no common link
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                median = np.nanmedian(flat, axis=1) \
+                    if configs else np.zeros(0)
+                mad = np.nanmedian(np.abs(flat - median[:, np.newaxis]),
+                                   axis=1) if configs else np.zeros(0)
+            z = (delta - median[:, np.newaxis, np.newaxis]) \
+                / (MAD_SCALE * mad[:, np.newaxis, np.newaxis])
+        significant = (np.abs(delta) >= min_delta) \
+            & (np.abs(np.nan_to_num(z, nan=0.)) > z_threshold)
+
+    # links table - one row per config and off-diagonal link
+    keep = np.broadcast_to(off_diagonal, delta.shape)
+    config_index, senders, receivers = np.nonzero(keep)
+    config_array = np.array(configs, dtype=int).reshape(-1, len(config_axes))
+    index_arrays = [config_array[config_index, i]
+                    for i in range(len(config_axes))]
+    node_array = np.array(node_ids, dtype=int)
+    links = pd.DataFrame(
+        dict(rssi_a=means_a[keep], rssi_b=means_b[keep], delta=delta[keep],
+             z=z[keep], significant=significant[keep]),
+        index=pd.MultiIndex.from_arrays(
+            index_arrays + [node_array[senders], node_array[receivers]],
+            names=list(config_axes) + ['sender', 'receiver']))
+
+    # per-node drift; nanmean warns about nodes with no common link
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        as_sender = np.nanmean(delta, axis=2)
+        as_receiver = np.nanmean(delta, axis=1)
+    involved = significant.sum(axis=2) + significant.sum(axis=1)
+    nodes = pd.DataFrame(
+        dict(as_sender=as_sender.ravel(), as_receiver=as_receiver.ravel(),
+             significant=involved.ravel()),
+        index=pd.MultiIndex.from_arrays(
+            [np.repeat(config_array[:, i], nb_nodes)
+             for i in range(len(config_axes))]
+            + [np.tile(node_array, len(configs))],
+            names=list(config_axes) + ['node_id']))
+    return RunDiff(run_a, run_b, links, nodes, only_a, only_b, method)
+
+
+def main():
+    """
+    prints the report for 2 runs
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-r", "--rssi-rank", default=0, type=int,
+                        help="which rssi value to compare")
+    parser.add_argument("-d", "--min-delta", default=1., type=float,
+                        help="smallest change in dB that can be significant")
+    parser.add_argument("-z", "--z-threshold", default=3., type=float,
+                        help="z-score above which a change is significant")
+    parser.add_argument("-t", "--top", default=10, type=int,
+                        help="how many nodes and links to show")
+    parser.add_argument("run_a")
+    parser.add_argument("run_b")
+    args = parser.parse_args()
+
+    diff = diff_runs(args.run_a, args.run_b, args.rssi_rank,
+                     args.min_delta, args.z_threshold)
+    print(diff.report(args.top))
+    return True
+
+
+if __name__ == '__main__':
+    exit(0 if main() else 1)
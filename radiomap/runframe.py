@@ -0,0 +1,93 @@
+"""
+Loading a whole run as a single pandas DataFrame
+
+The frame is indexed by
+    (tx_power, phy_rate, antenna_mask, channel, sender, receiver)
+and has one column per rssi rank, so that questions across configs
+boil down to a groupby; e.g. the mean RSSI vs tx power for all links
+
+    df = load_run('datasample')
+    df[0].groupby(level='tx_power').mean()
+
+Loaded frames are cached in <run_name>/RSSI-frame.pkl, and reused
+as long as no RSSI.txt file has changed
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from rssi import read_rssi_matrix, list_configs
+
+index_names = ['tx_power', 'phy_rate', 'antenna_mask', 'channel',
+               'sender', 'receiver']
+
+frame_name = "RSSI-frame.pkl"
+
+
+def _load_config(config, rssi_name):
+    """
+    the rows for one config, as a tuple index_arrays, values
+    """
+    node_ids, matrix = read_rssi_matrix(rssi_name)
+    nb_nodes = len(node_ids)
+    index_arrays = [np.full(nb_nodes * nb_nodes, value) for value in config]
+    index_arrays.append(np.repeat(node_ids, nb_nodes))
+    index_arrays.append(np.tile(node_ids, nb_nodes))
+    return index_arrays, matrix.reshape(nb_nodes * nb_nodes, -1)
+
+
+def _signature(rssi_names):
+    """
+    what must not have changed for the cache to remain valid
+    """
+    return sorted((str(name), name.stat().st_mtime_ns, name.stat().st_size)
+                  for name in rssi_names)
+
+
+def load_run(run_name, use_cache=True, max_workers=None):
+    """
+    scans all configs in run_name in parallel, and returns
+    a single DataFrame - see module docstring
+
+    Parameters:
+        run_name: the run directory
+        use_cache: whether RSSI-frame.pkl may be used and (re)written
+        max_workers: size of the process pool, default is
+          the number of cores
+    """
+    rssi_names = {config: path / "RSSI.txt"
+                  for config, path in list_configs(run_name)
+                  if (path / "RSSI.txt").exists()}
+    signature = _signature(rssi_names.values())
+    cache_name = Path(run_name) / frame_name
+    if use_cache and cache_name.exists():
+        cached = pd.read_pickle(str(cache_name))
+        if cached['signature'] == signature:
+            return cached['frame']
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        loaded = list(executor.map(_load_config, rssi_names.keys(),
+                                   rssi_names.values()))
+    nb_ranks = max((values.shape[1] for _, values in loaded), default=0)
+    if loaded:
+        index_arrays = [np.concatenate(arrays)
+                        for arrays in zip(*(arrays for arrays, _ in loaded))]
+        # configs with less antennas have less ranks
+        values = np.concatenate([
+            np.pad(values, ((0, 0), (0, nb_ranks - values.shape[1])),
+                   constant_values=np.nan)
+            for _, values in loaded])
+    else:
+        index_arrays = [np.zeros(0, dtype=int) for _ in index_names]
+        values = np.zeros((0, 0))
+    frame = pd.DataFrame(
+        values,
+        index=pd.MultiIndex.from_arrays(index_arrays, names=index_names),
+        columns=pd.RangeIndex(nb_ranks, name='rssi_rank'))
+
+    if use_cache:
+        pd.to_pickle(dict(signature=signature, frame=frame), str(cache_name))
+    return frame
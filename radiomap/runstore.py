@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+A binary, memory-mapped, flavour of a whole run directory
+
+A run, as created by acquiremap.all_runs, is a tree of
+t{t}-r{r}-a{a}-ch{ch}/RSSI.txt files; this module gathers all of them
+into a single float32 array indexed by
+
+    [tx_power, phy_rate, antenna_mask, channel, sender, receiver, rssi_rank]
+
+that is stored in <run_name>/RSSI.npy, together with a small
+metadata header in <run_name>/RSSI.json; missing values are NaN
+
+Once built, the store is memory-mapped on open, so that any map
+across the whole campaign is a plain numpy view
+"""
+
+import json
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+
+import numpy as np
+
+from rssi import read_rssi_matrix, list_configs
+from processmap import write_rssi
+
+# the 4 settings that make up a config, in this order
+config_axes = ('tx_power', 'phy_rate', 'antenna_mask', 'channel')
+
+STORE_VERSION = 1
+
+
+def store_names(run_name):
+    """
+    the locations of the array and of its metadata
+    """
+    root = Path(run_name)
+    return root / "RSSI.npy", root / "RSSI.json"
+
+
+def config_name(config):
+    """
+    the subdirectory name for a (tx_power, phy_rate, antenna_mask, channel)
+    tuple - same as in naming_scheme
+    """
+    return "t{}-r{}-a{}-ch{}".format(*config)
+
+
+def build_store(run_name):
+    """
+    reads all the RSSI.txt files in run_name, and writes
+    RSSI.npy and RSSI.json in that same directory
+
+    Returns:
+        the number of configs found
+    """
+    loaded = {}
+    for config, path in list_configs(run_name):
+        rssi_name = path / "RSSI.txt"
+        if rssi_name.exists():
+            loaded[config] = read_rssi_matrix(rssi_name)
+    axes = {
+        axis: sorted({config[i] for config in loaded})
+        for i, axis in enumerate(config_axes)
+    }
+    axes['node_id'] = sorted({node_id for node_ids, _ in loaded.values()
+                              for node_id in node_ids})
+    nb_ranks = max((matrix.shape[2] for _, matrix in loaded.values()),
+                   default=0)
+    shape = tuple(len(axes[axis]) for axis in config_axes) \
+        + (len(axes['node_id']), len(axes['node_id']), nb_ranks)
+
+    array_name, metadata_name = store_names(run_name)
+    array = np.lib.format.open_memmap(str(array_name), mode='w+',
+                                      dtype=np.float32, shape=shape)
+    array[...] = np.nan
+    configs = []
+    for config, (node_ids, matrix) in loaded.items():
+        index = tuple(axes[axis].index(value)
+                      for axis, value in zip(config_axes, config))
+        nodes = np.searchsorted(axes['node_id'], node_ids)
+        array[index][np.ix_(nodes, nodes, range(matrix.shape[2]))] = matrix
+        configs.append(dict(config=config, node_ids=node_ids,
+                            columns=matrix.shape[2]))
+    array.flush()
+    del array
+
+    metadata = dict(version=STORE_VERSION, shape=shape, dtype='float32',
+                    axes=axes, configs=configs)
+    with metadata_name.open('w') as metadata_file:
+        json.dump(metadata, metadata_file, indent=1)
+    return len(configs)
+
+
+def is_stale(run_name):
+    """
+    True if the store is missing or older than one of the RSSI.txt files
+    """
+    array_name, metadata_name = store_names(run_name)
+    if not array_name.exists() or not metadata_name.exists():
+        return True
+    built = min(array_name.stat().st_mtime, metadata_name.stat().st_mtime)
+    return any((path / "RSSI.txt").exists()
+               and (path / "RSSI.txt").stat().st_mtime > built
+               for _, path in list_configs(run_name))
+
+
+class RunStore:
+
+    """
+    a read-only, memory-mapped, view on a run
+
+    Example:
+        store = open_store('datasample')
+        # received power from sender 1 at tx power 14, rank 0,
+        # all receivers, for all rates, antenna masks and channels
+        store.data[store.index('tx_power', 14), :, :, :,
+                   store.node_index(1), :, 0]
+    """
+
+    def __init__(self, run_name):
+        self.run_name = run_name
+        array_name, metadata_name = store_names(run_name)
+        with metadata_name.open() as metadata_file:
+            self.metadata = json.load(metadata_file)
+        if self.metadata['version'] != STORE_VERSION:
+            raise ValueError("{}: unsupported version {}"
+                             .format(metadata_name,
+                                     self.metadata['version']))
+        self.axes = self.metadata['axes']
+        self.node_ids = self.axes['node_id']
+        # (tx_power, phy_rate, antenna_mask, channel) -> details
+        self.details = {tuple(details['config']): details
+                        for details in self.metadata['configs']}
+        self.data = np.load(str(array_name), mmap_mode='r')
+
+    def index(self, axis, value):
+        """
+        rank of value along one of the config axes
+        """
+        return self.axes[axis].index(value)
+
+    def node_index(self, node_id):
+        """
+        rank of node_id along the sender and receiver axes
+        """
+        return self.node_ids.index(node_id)
+
+    def configs(self):
+        """
+        the (tx_power, phy_rate, antenna_mask, channel) tuples
+        for which data is available
+        """
+        return list(self.details)
+
+    def matrix(self, tx_power, phy_rate, antenna_mask, channel):
+        """
+        a [sender, receiver, rssi_rank] view for one config
+        """
+        return self.data[self.index('tx_power', tx_power),
+                         self.index('phy_rate', phy_rate),
+                         self.index('antenna_mask', antenna_mask),
+                         self.index('channel', channel)]
+
+    def rssi_map(self, tx_power, phy_rate, antenna_mask, channel,
+                 sender, rssi_rank):
+        """
+        a view on the values received by all nodes when sender
+        is transmitting; indexed like node_ids
+        """
+        return self.matrix(tx_power, phy_rate, antenna_mask, channel)[
+            self.node_index(sender), :, rssi_rank]
+
+    def export(self, run_name=None):
+        """
+        writes back one RSSI.txt for each config, in the format
+        of processmap, under run_name (defaults to the store's own run)
+        """
+        root = Path(run_name or self.run_name)
+        for config in self.configs():
+            details = self.details[config]
+            nodes = [self.node_index(node_id)
+                     for node_id in details['node_ids']]
+            averages = self.matrix(*config)[np.ix_(
+                nodes, nodes, range(details['columns']))]
+            run_root = root / config_name(config)
+            run_root.mkdir(parents=True, exist_ok=True)
+            write_rssi(run_root / "RSSI.txt", details['node_ids'], averages)
+
+
+def open_store(run_name, rebuild=False):
+    """
+    returns a RunStore for run_name, (re)building it first
+    if needed, or if rebuild is set
+    """
+    if rebuild or is_stale(run_name):
+        build_store(run_name)
+    return RunStore(run_name)
+
+
+def main():
+    """
+    builds the store for one or several runs, and optionnally
+    exports their contents back as RSSI.txt files
+    """
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-e", "--export", default=None,
+                        help="a directory where to export RSSI.txt files")
+    parser.add_argument("run_names", nargs='+')
+    args = parser.parse_args()
+
+    for run_name in args.run_names:
+        store = open_store(run_name, rebuild=True)
+        print("{}: {} configs, shape {}"
+              .format(run_name, len(store.details), store.data.shape))
+        if args.export:
+            store.export(Path(args.export) / Path(run_name).name)
+    return True
+
+
+if __name__ == '__main__':
+    exit(0 if main() else 1)
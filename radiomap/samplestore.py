@@ -0,0 +1,151 @@
+"""
+Keeping all the individual rssi samples of a run, rather than
+just their averages
+
+Samples are stored as int8, one byte per antenna value, and grouped
+by link in contiguous arrays, CSR-style: the samples for link
+(sender, receiver) are values[offsets[link]:offsets[link+1]]
+where link = sender_rank * nb_nodes + receiver_rank
+
+Each sample also comes with a time: its capture timestamp in seconds
+since the epoch when the pcap files are processed locally (local_pcap
+or compact in acquiremap), and the rank of the frame in the
+result-<N>.txt file when they are processed with tshark on the nodes,
+as no timestamp comes back then; so as not to spoil the 1 byte per
+value, times are stored as uint32 offsets, in units of time_resolution,
+from the first time of each link, which is kept in bases
+
+The whole thing is saved in RSSI-samples.npz, next to RSSI.txt
+"""
+
+import numpy as np
+
+samples_name = "RSSI-samples.npz"
+
+# times are stored as multiples of this - 1ms, which is exact for
+# frame ranks, precise enough for capture timestamps, and allows a
+# link to span about 49 days
+time_resolution = 1e-3
+
+
+class SampleCollector:
+
+    """
+    accumulates chunks of samples, and saves them once sorted by link
+    """
+
+    def __init__(self, node_ids, columns):
+        self.node_ids = [int(id) for id in node_ids]
+        self.columns = columns
+        self.chunks = []
+
+    def add(self, links, rssis, times):
+        """
+        links, rssis and times are arrays with one entry per frame;
+        rssis has shape (number_of_frames, columns)
+        """
+        self.chunks.append((
+            np.asarray(links, dtype=np.int64),
+            np.clip(rssis, -128, 127).astype(np.int8).reshape(
+                -1, self.columns),
+            np.asarray(times, dtype=np.float64)))
+
+    def save(self, filename):
+        """
+        writes the samples in a .npz file, see SampleStore
+        """
+        if self.chunks:
+            links, values, times = (np.concatenate(arrays)
+                                    for arrays in zip(*self.chunks))
+        else:
+            links = np.zeros(0, dtype=np.int64)
+            values = np.zeros((0, self.columns), dtype=np.int8)
+            times = np.zeros(0)
+        # stable so that frames remain in capture order within a link
+        order = np.argsort(links, kind='stable')
+        links, times = links[order], times[order]
+        size = len(self.node_ids) ** 2
+        offsets = np.searchsorted(links, np.arange(size + 1))
+        # the first time of each link, 0 for links with no sample
+        bases = np.zeros(size)
+        present = offsets[:-1] < offsets[1:]
+        if len(times):
+            bases[present] = np.minimum.reduceat(times, offsets[:-1][present])
+        deltas = np.round((times - bases[links]) / time_resolution)
+        if len(deltas) and deltas.max() >= 2 ** 32:
+            raise ValueError("{}: times span too long".format(filename))
+        np.savez(str(filename), node_ids=np.array(self.node_ids),
+                 offsets=offsets, values=values[order], bases=bases,
+                 times=deltas.astype(np.uint32))
+
+
+class SampleStore:
+
+    """
+    read-only access to a RSSI-samples.npz file
+
+    Example:
+        store = SampleStore(run_root / samples_name)
+        values, counts = store.histogram(sender=1, receiver=2)
+    """
+
+    def __init__(self, filename):
+        with np.load(str(filename)) as npz:
+            self.node_ids = npz['node_ids'].tolist()
+            self.offsets = npz['offsets']
+            self.values = npz['values']
+            self.bases = npz['bases']
+            self.times = npz['times']
+        self.ranks = {node_id: rank
+                      for rank, node_id in enumerate(self.node_ids)}
+
+    def _link(self, sender, receiver):
+        return self.ranks[sender] * len(self.node_ids) + self.ranks[receiver]
+
+    def _slice(self, sender, receiver):
+        link = self._link(sender, receiver)
+        return slice(self.offsets[link], self.offsets[link + 1])
+
+    def samples(self, sender, receiver):
+        """
+        a (number_of_frames, columns) int8 view on the samples of one link
+        """
+        return self.values[self._slice(sender, receiver)]
+
+    def sample_times(self, sender, receiver):
+        """
+        the times of the samples of one link, as float64
+        """
+        return self.bases[self._link(sender, receiver)] \
+            + self.times[self._slice(sender, receiver)] * time_resolution
+
+    def histogram(self, sender, receiver, rssi_rank=0):
+        """
+        Returns:
+            a tuple values, counts of arrays, with the distinct
+            dBm values observed on that link, and how many times
+        """
+        return np.unique(self.samples(sender, receiver)[:, rssi_rank],
+                         return_counts=True)
+
+    def cdf(self, sender, receiver, rssi_rank=0):
+        """
+        Returns:
+            a tuple values, fractions, where fractions[i] is the
+            proportion of samples <= values[i]
+        """
+        values, counts = self.histogram(sender, receiver, rssi_rank)
+        cumulated = np.cumsum(counts)
+        if not len(cumulated):
+            return values, cumulated.astype(float)
+        return values, cumulated / cumulated[-1]
+
+    def window(self, sender, receiver, start, end):
+        """
+        the samples of one link whose time is in [start, end), in
+        seconds since the epoch, or in frame ranks when the run was
+        processed with tshark on the nodes, see the module docstring
+        """
+        times = self.sample_times(sender, receiver)
+        return self.samples(sender, receiver)[(times >= start) & (times < end)]
+
@@ -0,0 +1,579 @@
+"""
+An offline, in-process, stand-in for the testbed
+
+SimTestbed emulates a set of virtual fit nodes - and the gateway - so
+that the scripts in this directory can run with no access to faraday;
+its install() method replaces, in a script module, the apssh classes
+SshNode, SshJob, Run, RunScript and Pull with simulated ones that
+have the same interface, so the scheduler and jobs are unchanged
+
+On the virtual nodes, each node has its own directory, with tmp/ for
+/tmp and home/ for relative paths; the verbs of node-utilities.sh
+are emulated as follows
+* init-ad-hoc-network, reconfigure-ad-hoc-network: record the settings
+* tcpdump: captures, until pkill tcpdump, the frames received by the node
+* my-ping, my-ping-all: send frames whose received power follows a
+  log-distance path-loss model, with log-normal shadowing, a fixed
+  offset per antenna, and per-frame fading; frames below the receiver
+  sensitivity are lost, and so are their echo replies
+* process-pcap: writes result-<N>.txt, like tshark
+* anything else, e.g. run-batman, succeeds and does nothing
+
+The pcap files are genuine radiotap captures, so they can go through
+pcapreader; routing protocols are not simulated, all pings are single-hop
+
+Example:
+    testbed = SimTestbed(positions)
+    testbed.install(acquiremap, connpool)
+    acquiremap.one_run('ath9k', 5, 1, 7, 1, node_ids=range(1, 38))
+"""
+
+import asyncio
+import io
+import re
+import shlex
+import shutil
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from asynciojobs import AbstractJob
+
+# the nodes are 10.0.0.<N>
+MAX_NODE_ID = 254
+
+# model parameters
+PATHLOSS_EXPONENT = 2.7
+SHADOWING_SIGMA = 6.
+ANTENNA_SIGMA = 2.
+FADING_SIGMA = 1.
+# in dBm, for the legacy rates
+sensitivities = {1: -94, 2: -91, 5: -89, 6: -90, 9: -89, 11: -88, 12: -87,
+                 18: -85, 24: -82, 36: -78, 48: -74, 54: -73}
+
+# emulated durations in seconds, multiplied by time_scale
+durations = dict(handshake=0.5, init=20., reconfigure=3.)
+
+# the radiotap header, see pcapreader: Flags, Channel, dBm antenna signal
+# then for each antenna a dBm antenna signal and an Antenna field
+PRESENT_FLAGS_CHANNEL_SIGNAL = (1 << 1) | (1 << 3) | (1 << 5)
+PRESENT_SIGNAL_ANTENNA = (1 << 5) | (1 << 11)
+PRESENT_RADIOTAP_EXT = (1 << 29) | (1 << 31)
+LLC_SNAP_IPV4 = b'\xaa\xaa\x03\x00\x00\x00\x08\x00'
+
+
+def default_positions(node_ids, width=9):
+    """
+    lays nodes on a grid, width nodes per row, 1m apart
+    """
+    return {node_id: ((node_id - 1) % width, (node_id - 1) // width)
+            for node_id in node_ids}
+
+
+def node_number(hostname):
+    """
+    the node id for a fitNN hostname, None for the gateway
+    """
+    match = re.fullmatch(r"fit(\d+)", hostname)
+    return int(match.group(1)) if match else None
+
+
+def frames_template(nb_chains, size):
+    """
+    the bytes of one pcap record for an ICMP frame, and the offsets
+    in there of the timestamps, of the dBm values, and of the addresses
+
+    Returns:
+        a tuple (template, offsets) where offsets is a dict
+    """
+    words = [PRESENT_FLAGS_CHANNEL_SIGNAL
+             | (PRESENT_RADIOTAP_EXT if nb_chains else 0)]
+    for chain in range(nb_chains):
+        last = chain == nb_chains - 1
+        words.append(PRESENT_SIGNAL_ANTENNA
+                     | (0 if last else PRESENT_RADIOTAP_EXT))
+    # flags (1 byte), pad, channel (2+2), signal, then (signal, antenna)s
+    position = 4 + 4 * len(words)
+    fields = bytearray(b'\x00')
+    if (position + len(fields)) % 2:
+        fields += b'\x00'
+    fields += (2412).to_bytes(2, 'little') + (0xa0).to_bytes(2, 'little')
+    signals = [position + len(fields)]
+    fields += b'\x00'
+    for chain in range(nb_chains):
+        signals.append(position + len(fields))
+        fields += bytes([0, chain])
+    radiotap = bytearray(4 + 4 * len(words) + len(fields))
+    radiotap[2:4] = len(radiotap).to_bytes(2, 'little')
+    for index, word in enumerate(words):
+        radiotap[4 + 4 * index:8 + 4 * index] = word.to_bytes(4, 'little')
+    radiotap[4 + 4 * len(words):] = fields
+
+    dot11 = bytes([0x08, 0x00]) + bytes(22)
+    ip = bytearray(20)
+    ip[0], ip[8], ip[9] = 0x45, 64, 1
+    ip[2:4] = (20 + 8 + size).to_bytes(2, 'big')
+    frame = bytes(radiotap) + dot11 + LLC_SNAP_IPV4 + bytes(ip) \
+        + bytes([8]) + bytes(7 + size)
+    ip_start = 16 + len(radiotap) + len(dot11) + len(LLC_SNAP_IPV4)
+    offsets = dict(signals=[16 + signal for signal in signals],
+                   src=ip_start + 12, dst=ip_start + 16)
+    return bytes(16) + frame, offsets
+
+
+def pcap_records(src, dst, dbms, times, size, snaplen):
+    """
+    the pcap records for a batch of frames from src to dst
+
+    Parameters:
+        dbms: an int array of shape (frames, values), the first value
+          being the combined signal, and then one per antenna
+        times: the capture times in seconds
+    """
+    template, offsets = frames_template(dbms.shape[1] - 1, size)
+    records = np.tile(np.frombuffer(template, dtype=np.uint8),
+                      (len(times), 1))
+    seconds = np.floor(times)
+    header = np.stack([seconds, np.round((times - seconds) * 1e6),
+                       np.full(len(times), min(snaplen, len(template) - 16)),
+                       np.full(len(times), len(template) - 16)],
+                      axis=1).astype('<u4')
+    records[:, :16] = header.view(np.uint8).reshape(len(times), 16)
+    for column, offset in enumerate(offsets['signals']):
+        records[:, offset] = dbms[:, column].astype(np.int8).view(np.uint8)
+    records[:, offsets['src']:offsets['src'] + 4] = [10, 0, 0, src]
+    records[:, offsets['dst']:offsets['dst'] + 4] = [10, 0, 0, dst]
+    # truncate to snaplen
+    return records[:, :16 + min(snaplen, len(template) - 16)].tobytes()
+
+
+class VirtualNode:
+
+    """
+    the state of one virtual fit node
+    """
+
+    def __init__(self, node_id, position, root):
+        self.node_id = node_id
+        self.position = np.array(position, dtype=float)
+        self.root = root
+        for subdir in ('tmp', 'home'):
+            (root / subdir).mkdir(parents=True, exist_ok=True)
+        # None until init-ad-hoc-network
+        self.settings = None
+        # while tcpdump runs: output file, snaplen, pcap records,
+        # and the (src, dbms) frames for process-pcap
+        self.capture = None
+        self.stopped = asyncio.Event()
+        self.frames = {}
+
+    def path(self, name):
+        """
+        maps a path on the node into the local filesystem
+        """
+        if name.startswith('/tmp/'):
+            return self.root / 'tmp' / name[len('/tmp/'):]
+        return self.root / 'home' / name
+
+    def nb_chains(self):
+        """
+        how many per-antenna values the driver reports
+        """
+        if self.settings['driver'] != 'ath9k':
+            return 0
+        return bin(self.settings['antmask']).count('1')
+
+
+class SimConnection:
+
+    """
+    stands for an asyncssh connection
+    """
+
+    class Result:
+        exit_status = 0
+
+    async def run(self, command, check=False):          # pylint: disable=w0613
+        return self.Result()
+
+
+class SimNode:
+
+    """
+    a stand-in for apssh.SshNode; install() creates a subclass
+    where testbed is set
+    """
+
+    testbed = None
+
+    def __init__(self, hostname, *, username=None, gateway=None,
+                 **kwds):                               # pylint: disable=w0613
+        self.hostname = hostname
+        self.username = username
+        self.gateway = gateway
+        self.node_id = node_number(hostname)
+        self.conn = None
+
+    def __repr__(self):
+        return "<SimNode {}@{}>".format(self.username, self.hostname)
+
+    def is_connected(self):
+        return self.conn is not None
+
+    async def connect_lazy(self):
+        if self.conn is None:
+            await self.testbed.elapse(durations['handshake'])
+            self.conn = SimConnection()
+        return self.conn
+
+    async def close(self):
+        self.conn = None
+
+
+class SimCommandFailed(Exception):
+    pass
+
+
+class Run:
+
+    """
+    a stand-in for apssh.Run
+    """
+
+    def __init__(self, *argv, **kwds):                  # pylint: disable=w0613
+        self.command = " ".join(str(arg) for arg in argv)
+
+    async def co_sim(self, node):
+        testbed = node.testbed
+        for part in self.command.split(';'):
+            argv = shlex.split(part)
+            if not argv:
+                continue
+            if argv[0] == 'sleep':
+                await testbed.elapse(float(argv[1]))
+            elif argv[0] == 'pkill' and 'tcpdump' in argv:
+                testbed.stop_capture(node.node_id)
+            elif argv[0] == 'tcpdump':
+                await testbed.capture(node.node_id, argv)
+            elif argv[:2] == ['rhubarbe', 'load']:
+                testbed.reset(int(id) for id in argv[4:])
+        return 0
+
+
+class RunScript:
+
+    """
+    a stand-in for apssh.RunScript, see the module docstring
+    for the emulated node-utilities.sh verbs
+    """
+
+    def __init__(self, local_script, *args, **kwds):    # pylint: disable=w0613
+        self.script = Path(local_script).name
+        self.args = [str(arg) for arg in args]
+
+    async def co_sim(self, node):
+        args, output = self.args, None
+        if '>' in args:
+            output = node.testbed.nodes[node.node_id].path(
+                args[args.index('>') + 1])
+            args = args[:args.index('>')]
+        if self.script == 'pcapreader.py':
+            text = node.testbed.encode(node.node_id, args)
+        else:
+            text = await node.testbed.verb(node.node_id, args[0], args[1:])
+        if output is not None:
+            output.write_text(text)
+        return 0
+
+
+class Pull:
+
+    """
+    a stand-in for apssh.Pull
+    """
+
+    def __init__(self, remotepaths, localpath, **kwds): # pylint: disable=w0613
+        if isinstance(remotepaths, str):
+            remotepaths = [remotepaths]
+        self.remotepaths = remotepaths
+        self.localpath = Path(localpath)
+
+    async def co_sim(self, node):
+        virtual = node.testbed.nodes[node.node_id]
+        for remotepath in self.remotepaths:
+            path = virtual.path(remotepath)
+            if not path.exists():
+                return 1
+            shutil.copy(str(path), str(self.localpath / path.name))
+        return 0
+
+
+class SimJob(AbstractJob):
+
+    """
+    a stand-in for apssh.SshJob
+    """
+
+    def __init__(self, node, *, command=None, commands=None,
+                 keep_connection=False, verbose=None,  # pylint: disable=w0613
+                 forever=False, critical=True, **kwds):
+        self.node = node
+        self.commands = list(commands) if commands else [command]
+        self.keep_connection = keep_connection
+        super().__init__(forever=forever, critical=critical, **kwds)
+
+    async def co_run(self):
+        await self.node.connect_lazy()
+        result = 0
+        for command in self.commands:
+            result = await command.co_sim(self.node)
+            if result != 0:
+                raise SimCommandFailed("{} failed on {}"
+                                       .format(type(command).__name__,
+                                               self.node.hostname))
+        return result
+
+    async def co_shutdown(self):
+        if not self.keep_connection:
+            await self.node.close()
+
+
+class SimTestbed:
+
+    """
+    a set of virtual nodes, and the propagation model between them
+
+    Parameters:
+        positions: a dict node_id -> (x, y) in meters; nodes that are
+          not in there are laid out with default_positions
+        seed: the random seed; shadowing and antenna offsets only
+          depend on the seed and on the link
+        time_scale: emulated durations (handshakes, node
+          initialization, sleeps, pings) are multiplied by this;
+          the default 0 runs everything as fast as possible
+        root: where the virtual nodes files are stored, a temporary
+          directory by default
+    """
+
+    def __init__(self, positions=None, seed=0, time_scale=0., root=None):
+        self.positions = dict(positions or {})
+        self.seed = seed
+        self.time_scale = time_scale
+        self.root = Path(root or tempfile.mkdtemp(prefix="simtestbed-"))
+        self.nodes = {}
+        # capture timestamps start now, and move with each ping
+        self.clock = time.time()
+
+    def node(self, node_id):
+        """
+        the VirtualNode for node_id, created on first use
+        """
+        if node_id not in self.nodes:
+            if not 1 <= node_id <= MAX_NODE_ID:
+                raise ValueError("cannot simulate node {}".format(node_id))
+            position = self.positions.get(node_id)
+            if position is None:
+                position = default_positions([node_id])[node_id]
+            self.nodes[node_id] = VirtualNode(
+                node_id, position, self.root / "fit{:02d}".format(node_id))
+        return self.nodes[node_id]
+
+    def install(self, *modules, settle_delay=0):
+        """
+        replaces SshNode, SshJob, Run, RunScript and Pull in modules
+        with their simulated counterparts; settle_delay, if defined
+        in a module, is set as well
+        """
+        node_class = type('SshNode', (SimNode,), dict(testbed=self))
+        replacements = dict(SshNode=node_class, SshJob=SimJob, Run=Run,
+                            RunScript=RunScript, Pull=Pull)
+        for module in modules:
+            for name, replacement in replacements.items():
+                if hasattr(module, name):
+                    setattr(module, name, replacement)
+            if hasattr(module, 'settle_delay'):
+                module.settle_delay = settle_delay
+
+    def cleanup(self):
+        """
+        removes the virtual nodes files
+        """
+        shutil.rmtree(str(self.root), ignore_errors=True)
+
+    async def elapse(self, duration):
+        """
+        emulates something that takes duration seconds
+        """
+        if self.time_scale:
+            await asyncio.sleep(duration * self.time_scale)
+
+    def reset(self, node_ids):
+        """
+        what happens to nodes when they are loaded
+        """
+        for node_id in node_ids:
+            node = self.node(node_id)
+            node.settings, node.capture = None, None
+
+    # the propagation model
+    def _link_rng(self, *key):
+        return np.random.default_rng([self.seed] + [int(k) for k in key])
+
+    def rssi(self, sender, receiver, count):
+        """
+        count samples of the received power, as an int array
+        of shape (count, 1 + number of antennas of receiver)
+        """
+        tx, rx = self.node(sender), self.node(receiver)
+        frequency = rx.settings['freq']
+        distance = max(np.linalg.norm(tx.position - rx.position), 0.5)
+        # free space loss at 1m, and then log-distance
+        loss = 20 * np.log10(frequency) - 27.55 \
+            + 10 * PATHLOSS_EXPONENT * np.log10(distance)
+        # shadowing is the same both ways
+        low, high = sorted((sender, receiver))
+        shadowing = self._link_rng(low, high, frequency).normal(
+            0, SHADOWING_SIGMA)
+        chains = max(rx.nb_chains(), 1)
+        offsets = self._link_rng(sender, receiver, frequency, 1).normal(
+            0, ANTENNA_SIGMA, chains)
+        mean = tx.settings['txpower'] / 100 - loss + shadowing
+        fading = np.random.default_rng().normal(
+            0, FADING_SIGMA, (count, chains))
+        per_chain = mean + offsets + fading
+        combined = 10 * np.log10((10 ** (per_chain / 10)).sum(axis=1))
+        values = np.column_stack([combined] + (
+            [per_chain] if rx.nb_chains() else []))
+        return np.round(values).astype(int)
+
+    def can_hear(self, sender, receiver):
+        tx, rx = self.node(sender), self.node(receiver)
+        return tx.settings is not None and rx.settings is not None \
+            and tx.settings['freq'] == rx.settings['freq']
+
+    def transmit(self, sender, receiver, count, size, interval):
+        """
+        count frames from sender to receiver, recorded in the receiver
+        capture if it runs
+
+        Returns:
+            a boolean mask of the frames that were received
+        """
+        if not self.can_hear(sender, receiver):
+            return np.zeros(count, dtype=bool)
+        dbms = self.rssi(sender, receiver, count)
+        threshold = sensitivities.get(
+            self.node(sender).settings['phyrate'], -90)
+        received = dbms[:, 0] >= threshold
+        times = self.clock + interval * np.arange(count)
+        capture = self.node(receiver).capture
+        if capture is not None and received.any():
+            capture['records'].append(pcap_records(
+                sender, receiver, dbms[received], times[received], size,
+                capture['snaplen']))
+            capture['frames'].append((sender, dbms[received]))
+        return received
+
+    async def ping(self, sender, destination, interval, size, number):
+        """
+        emulates a ping, returns the output of my-ping
+        """
+        receiver = int(destination.split('.')[-1])
+        requests = self.transmit(sender, receiver, number, size, interval)
+        replies = self.transmit(receiver, sender, number, size, interval)
+        answered = int((requests & replies).sum())
+        self.clock += number * interval
+        await self.elapse(number * interval)
+        return ("fit{:02d} -> {}: {} packets transmitted, {} received,"
+                " {}% packet loss\n"
+                .format(sender, destination, number, answered,
+                        round(100 * (number - answered) / number)))
+
+    # the node side
+    async def capture(self, node_id, argv):
+        """
+        runs tcpdump until pkill tcpdump
+        """
+        node = self.node(node_id)
+        snaplen = int(argv[argv.index('-s') + 1]) if '-s' in argv else 65535
+        node.capture = dict(output=argv[argv.index('-w') + 1],
+                            snaplen=snaplen, records=[], frames=[])
+        node.stopped.clear()
+        await node.stopped.wait()
+
+    def stop_capture(self, node_id):
+        """
+        pkill tcpdump: writes the pcap file, and keeps the
+        frames for process-pcap
+        """
+        node = self.node(node_id)
+        capture = node.capture
+        if capture is None:
+            return
+        header = np.array([0xa1b2c3d4], dtype='<u4').tobytes() \
+            + np.array([2, 4], dtype='<u2').tobytes() \
+            + np.array([0, 0, capture['snaplen'], 127], dtype='<u4').tobytes()
+        with node.path(capture['output']).open('wb') as pcap:
+            pcap.write(header)
+            for records in capture['records']:
+                pcap.write(records)
+        node.frames = capture['frames']
+        node.capture = None
+        node.stopped.set()
+
+    async def verb(self, node_id, verb, args):
+        """
+        emulates node-utilities.sh, returns the output
+        """
+        node = self.node(node_id)
+        if verb in ('init-ad-hoc-network', 'reconfigure-ad-hoc-network'):
+            driver, _, freq, phyrate, antmask, txpower = args[:6]
+            node.settings = dict(driver=driver, freq=int(freq),
+                                 phyrate=int(phyrate), antmask=int(antmask),
+                                 txpower=int(txpower))
+            await self.elapse(durations['init' if verb.startswith('init')
+                                        else 'reconfigure'])
+            return ""
+        if verb == 'my-ping':
+            destination, _, interval, size, number = args
+            return await self.ping(node_id, destination, float(interval),
+                                   int(size), int(number))
+        if verb == 'my-ping-all':
+            src, tarname, _, interval, size, number, *destinations = args
+            with tarfile.open(str(node.path(tarname)), 'w') as archive:
+                for destination in destinations:
+                    text = await self.ping(
+                        node_id, "10.0.0.{}".format(destination),
+                        float(interval), int(size), int(number))
+                    contents = text.encode()
+                    info = tarfile.TarInfo("PING-{:02d}-{:02d}".format(
+                        int(src), int(destination)))
+                    info.size = len(contents)
+                    archive.addfile(info, io.BytesIO(contents))
+            return ""
+        if verb == 'process-pcap':
+            with node.path("/tmp/result-{}.txt".format(args[0])).open('w') \
+                    as result:
+                for sender, dbms in node.frames:
+                    for values in dbms.tolist():
+                        result.write("10.0.0.{}\t10.0.0.{}\t{}\n".format(
+                            sender, node_id,
+                            ",".join(str(value) for value in values)))
+            return ""
+        # run-batman, kill-olsr and the like
+        return ""
+
+    def encode(self, node_id, args):
+        """
+        emulates pcapreader.py --encode on the node
+        """
+        from pcapreader import encode_pcap
+        node = self.node(node_id)
+        pcap_name, encoded_name = args[args.index('--encode') + 1:][:2]
+        dst = args[args.index('--dst') + 1] if '--dst' in args else None
+        frames = encode_pcap(node.path(pcap_name), node.path(encoded_name),
+                             dst)
+        return "{}: {} frames\n".format(encoded_name, frames)